@@ -0,0 +1,269 @@
+""" Index of tacc stats archive files, so planners need not decompress them """
+import argparse
+import os
+import sqlite3
+import sys
+
+import numpy
+
+from example_parser import (SF_PROPERTY_CHAR, SF_SCHEMA_CHAR,
+                            get_host_directories,
+                            get_list_of_files_in_directory, open_stats_block,
+                            schema_fingerprint)
+
+DEFAULT_ARCHIVE_INDEX = 'archive_index.db'
+
+SCHEMA_STATEMENTS = (
+    """CREATE TABLE IF NOT EXISTS archives (
+           path TEXT PRIMARY KEY,
+           size INTEGER NOT NULL,
+           mtime REAL NOT NULL,
+           hostname TEXT,
+           tacc_version TEXT,
+           schema_fingerprint TEXT,
+           first_timestamp REAL,
+           last_timestamp REAL,
+           line_count INTEGER NOT NULL)""",
+    "CREATE INDEX IF NOT EXISTS idx_arch_host_ts ON archives (hostname, first_timestamp)",
+    "CREATE INDEX IF NOT EXISTS idx_arch_ts ON archives (first_timestamp, last_timestamp)",
+    "CREATE INDEX IF NOT EXISTS idx_arch_version ON archives (tacc_version)",
+)
+
+COLUMNS = ('path', 'size', 'mtime', 'hostname', 'tacc_version',
+           'schema_fingerprint', 'first_timestamp', 'last_timestamp',
+           'line_count')
+
+
+def _first_field(line):
+    return float(line.split(None, 1)[0])
+
+
+def scan_archive(path):
+
+    """
+    Decompresses one archive file and returns its index entry as a dict
+    with the keys in COLUMNS. Files without a header or timestamps get None
+    for the fields they lack, and archives that cannot be decompressed to
+    the end are indexed from the part open_stats_block reads.
+    """
+
+    stat = os.stat(path)
+    entry = dict.fromkeys(COLUMNS)
+    entry.update(path=path, size=stat.st_size, mtime=stat.st_mtime,
+                 line_count=0)
+    if stat.st_size <= 31:  # the size read_all_gz_files treats as empty
+        return entry
+
+    block = open_stats_block(path)
+    entry['line_count'] = block.line_count
+    schema_descs = {}
+    for line in block:
+        char = line[0]
+        if char == SF_SCHEMA_CHAR:
+            type_name, schema_desc = line[1:].split(None, 1)
+            schema_descs[type_name] = schema_desc
+        elif char == SF_PROPERTY_CHAR:
+            if line.startswith("$tacc_stats"):
+                entry['tacc_version'] = line.split(" ")[1].strip()
+            if line.startswith("$hostname"):
+                entry['hostname'] = line.split(" ")[1].strip()
+    if schema_descs:
+        entry['schema_fingerprint'] = schema_fingerprint(schema_descs)
+
+    timestamp_lines = numpy.flatnonzero(
+        (block.first_chars[block.header_end:] - ord('0')) < 10) + \
+        block.header_end
+    for key, index in (('first_timestamp', 0), ('last_timestamp', -1)):
+        if len(timestamp_lines):
+            line_number = timestamp_lines[index]
+            line = block.data[block.line_starts[line_number]:
+                              block.line_ends[line_number]]
+            try:
+                entry[key] = _first_field(line)
+            except ValueError:
+                pass
+    return entry
+
+
+class ArchiveIndex(object):
+
+    """
+    Local SQLite index of archive files holding, for each file, its
+    hostname, $tacc_stats version, schema fingerprint, first and last
+    timestamp, line count and size. refresh only decompresses files that
+    are new or whose size or mtime changed since they were indexed, and
+    the query methods answer from the index alone.
+    """
+
+    def __init__(self, path=DEFAULT_ARCHIVE_INDEX):
+
+        self.path = path
+        self.con = sqlite3.connect(path)
+        for statement in SCHEMA_STATEMENTS:
+            self.con.execute(statement)
+        self.con.commit()
+
+    def close(self):
+        self.con.close()
+
+    def refresh(self, root):
+
+        """
+        Brings the index up to date with the '.gz' files under root, a
+        hostname directory or a directory of hostname directories. Files are
+        indexed by absolute path, so one file is found however root is
+        spelled; entries left by older indexes under relative paths are
+        removed. Returns the number of files (scanned, removed).
+        """
+
+        directories = get_host_directories(os.path.abspath(root))
+        known = dict((row[0], (row[1], row[2])) for row in self.con.execute(
+            "SELECT path, size, mtime FROM archives"))
+        present = set()
+        scanned = 0
+        for directory in directories:
+            for afile in sorted(get_list_of_files_in_directory(directory)):
+                present.add(afile)
+                stat = os.stat(afile)
+                if known.get(afile) == (stat.st_size, stat.st_mtime):
+                    continue
+                entry = scan_archive(afile)
+                self.con.execute(
+                    "INSERT OR REPLACE INTO archives (%s) VALUES (%s)" % (
+                        ', '.join(COLUMNS), ', '.join('?' * len(COLUMNS))),
+                    [entry[column] for column in COLUMNS])
+                scanned += 1
+
+        prefixes = tuple(os.path.join(directory, '')
+                         for directory in directories)
+        removed = [(afile,) for afile in known
+                   if not os.path.isabs(afile) or
+                   (afile.startswith(prefixes) and afile not in present)]
+        self.con.executemany("DELETE FROM archives WHERE path = ?", removed)
+        self.con.commit()
+        return scanned, len(removed)
+
+    def entries(self, hostname=None):
+
+        """
+        Returns the index entries, as dicts, optionally of a single host,
+        ordered by host and time
+        """
+
+        query = "SELECT %s FROM archives" % ', '.join(COLUMNS)
+        params = []
+        if hostname is not None:
+            query += " WHERE hostname = ?"
+            params.append(hostname)
+        query += " ORDER BY hostname, first_timestamp, path"
+        return [dict(zip(COLUMNS, row))
+                for row in self.con.execute(query, params)]
+
+    def files_in_window(self, start=None, end=None, hostname=None):
+
+        """
+        Returns the paths of the files with samples in the window
+        [start, end), ordered by host and time. Files without timestamps
+        are left out.
+        """
+
+        clauses = ['first_timestamp IS NOT NULL']
+        params = []
+        if end is not None:
+            clauses.append('first_timestamp < ?')
+            params.append(end)
+        if start is not None:
+            clauses.append('last_timestamp >= ?')
+            params.append(start)
+        if hostname is not None:
+            clauses.append('hostname = ?')
+            params.append(hostname)
+        query = "SELECT path FROM archives WHERE " + ' AND '.join(clauses) + \
+                " ORDER BY hostname, first_timestamp, path"
+        return [row[0] for row in self.con.execute(query, params)]
+
+    def versions(self):
+
+        """
+        Returns (tacc_version, schema_fingerprint, hosts, files,
+        first_timestamp, last_timestamp) for every version and schema seen,
+        the time ranges per-version analyses such as kernel_comparison.R
+        compare
+        """
+
+        return self.con.execute(
+            "SELECT tacc_version, schema_fingerprint, "
+            "COUNT(DISTINCT hostname), COUNT(*), MIN(first_timestamp), "
+            "MAX(last_timestamp) FROM archives "
+            "GROUP BY tacc_version, schema_fingerprint "
+            "ORDER BY MIN(first_timestamp)").fetchall()
+
+    def shards(self, count):
+
+        """
+        Splits the indexed files into count lists of paths of roughly equal
+        total size. All files of a host stay in the same shard, in time
+        order, since a host's files must be read in sequence.
+        """
+
+        hosts = {}
+        for entry in self.entries():
+            hosts.setdefault(entry['hostname'], []).append(entry)
+        shards = [[] for _ in range(count)]
+        sizes = [0] * count
+        for host_entries in sorted(hosts.values(), reverse=True,
+                                   key=lambda entries: sum(
+                                       entry['size'] for entry in entries)):
+            smallest = sizes.index(min(sizes))
+            shards[smallest].extend(entry['path'] for entry in host_entries)
+            sizes[smallest] += sum(entry['size'] for entry in host_entries)
+        return shards
+
+
+def main():
+
+    """
+    Refreshes an archive index and optionally prints one of its plans
+    """
+
+    parser = argparse.ArgumentParser(description='Index tacc stats archive '
+                                     'files')
+    parser.add_argument('directory', help='hostname directory or directory '
+                        'of hostname directories to index')
+    parser.add_argument('--index', default=DEFAULT_ARCHIVE_INDEX,
+                        help='index file (default: %(default)s)')
+    subparsers = parser.add_subparsers(dest='plan')
+    subparsers.add_parser('refresh', help='only refresh the index')
+    window = subparsers.add_parser('window', help='files with samples in a '
+                                   'time window')
+    window.add_argument('--start', type=float)
+    window.add_argument('--end', type=float)
+    window.add_argument('--host')
+    subparsers.add_parser('versions', help='tacc_stats versions and schemas')
+    shards = subparsers.add_parser('shards', help='split files into shards '
+                                   'of similar size')
+    shards.add_argument('count', type=int)
+    args = parser.parse_args()
+
+    index = ArchiveIndex(args.index)
+    scanned, removed = index.refresh(args.directory)
+    sys.stderr.write('Indexed %d new or changed files, dropped %d\n' % (
+        scanned, removed))
+    if args.plan == 'window':
+        rows = [(path,) for path in index.files_in_window(
+            args.start, args.end, args.host)]
+    elif args.plan == 'versions':
+        rows = index.versions()
+    elif args.plan == 'shards':
+        rows = [(number, path)
+                for number, shard in enumerate(index.shards(args.count))
+                for path in shard]
+    else:
+        rows = []
+    for row in rows:
+        sys.stdout.write('\t'.join(str(col) for col in row) + '\n')
+    index.close()
+
+
+if __name__ == "__main__":
+    main()
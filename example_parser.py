@@ -1,6 +1,9 @@
 """ X """
-import MySQLdb as mdb
+import argparse
+import collections
 import gzip
+import hashlib
+import json
 import logging
 import string
 import os
@@ -8,6 +11,10 @@ import sys
 import time
 import datetime
 import re
+import shutil
+import signal
+import tempfile
+import zlib
 import numpy
 
 SF_SCHEMA_CHAR = '!'
@@ -16,6 +23,23 @@ SF_COMMENT_CHAR = '#'
 SF_PROPERTY_CHAR = '$'
 SF_MARK_CHAR = '%'
 
+CPU_TOTAL_KEYS = ('user', 'nice', 'system', 'idle', 'iowait', 'irq',
+                  'softirq')
+NEWLINE_BYTE = ord('\n')
+POWERS_OF_TEN = numpy.array([10 ** k for k in range(20)], dtype=numpy.uint64)
+BLOCK_CHUNK_BYTES = 1 << 18  # bytes of a StatsBlock parsed at once
+
+DEFAULT_GAP_THRESHOLD = 1200  # longest expected time between two samples
+HOSTNAME_REGEX = re.compile(r"(\w+-\w+.stampede.tacc.utexas.edu)")
+
+SINKS = ('text', 'jsonl', 'sqlite', 'mysql')
+DEFAULT_SINKS = ('text', 'sqlite', 'mysql')
+WATCH_SINKS = ('text', 'sqlite')
+
+RebootInterval = collections.namedtuple('RebootInterval',
+                                        'host start end filename')
+GapInterval = collections.namedtuple('GapInterval', 'host start end filename')
+
 (PENDING_FIRST_RECORD, ACTIVE, ACTIVE_IGNORE, LAST_RECORD, DONE) = range(0, 5)
 STATENAMES = {
     PENDING_FIRST_RECORD: "PENDING_FIRST_RECORD",
@@ -91,6 +115,22 @@ def schema_fixup(type_name, desc):
     return desc
 
 
+def schema_fingerprint(schema_descs):
+
+    """
+    Returns a short fingerprint identifying a set of schemas. schema_descs
+    maps type names to schema descriptions as found in a file header, they
+    are fixed up with schema_fixup first so files that only differ by the
+    known schema errors get the same fingerprint.
+    """
+
+    canonical = '\n'.join('%s %s' % (type_name,
+                                     ' '.join(schema_fixup(type_name,
+                                                           desc).split()))
+                          for type_name, desc in sorted(schema_descs.items()))
+    return hashlib.sha1(canonical).hexdigest()[:16]
+
+
 class SchemaEntry(object):
     __slots__ = ('key',
                  'index',
@@ -158,17 +198,34 @@ class SchemaEntry(object):
 
 
 class Schema(dict):
-    def __init__(self, desc):
+    def __init__(self, desc, fingerprint=None):
         dict.__init__(self)
         self.desc = desc
+        self.fingerprint = fingerprint
         self._key_list = []
         self._value_list = []
+        self._column_indices = {}
         for index, schema in enumerate(desc.split()):
             entry_point = SchemaEntry(index, schema)
             dict.__setitem__(self, entry_point.key, entry_point)
             self._key_list.append(entry_point.key)
             self._value_list.append(entry_point)
 
+    def column_indices(self, keys):
+
+        """
+        Returns a numpy array of the column indices of keys, leaving out the
+        keys this schema does not have. The mapping is computed once per
+        tuple of keys.
+        """
+
+        indices = self._column_indices.get(keys)
+        if indices is None:
+            indices = self._column_indices[keys] = numpy.array(
+                [self[key].index for key in keys if key in self],
+                dtype=numpy.intp)
+        return indices
+
     def __iter__(self):
         return self._key_list.__iter__()
 
@@ -214,63 +271,92 @@ class Schema(dict):
         return self._value_list
 
 
-class MaintainState(object):
+class SchemaRegistry(object):
 
     """
-    Used to store data in between instances of the SimpleTaccParser. The list
-    self.last_cpu_total_vals stores the total cpu timings. self.not_first_file
-    stires a boolean value, used in checking if the file is the first in
-    directory. Also handles storing the reboot data text file's file
-    name and ensuring only one file is made via the boolean self.file_created
+    Holds every schema version seen for each type, keyed by the
+    fingerprint of its fixed up description, so files written by different
+    tacc_stats versions are each parsed with their own schema. Column
+    mappings used by the checks are compiled when a version is registered.
     """
 
     def __init__(self):
-        self.last_cpu_total_vals = []
-        self.previous_cpu_total_time_list = 0
-        self.all_error_dict = {}
-        self.not_first_file = False
-        self.file_created = False
-        self.previous_timestamp = 0
-        self.reboot_data_filename = ""
-        self.previous_filename = ""
-        self.time_gap_data = ""
+        self.versions = {}
+        self._by_desc = {}
 
-    def set_last_cpu_total_vals(self, a_list):
+    def get(self, type_name, desc):
 
         """
-        Mutates the instance variable self.last_cpu_total_vals, used to store
-        total cpu timing data from a previous instance of SimpleTaccParser
+        Returns the Schema for the description desc of type_name found in a
+        file header, registering it as a new version if it was not seen
+        before
         """
 
-        self.last_cpu_total_vals = a_list
+        schema = self._by_desc.get((type_name, desc))
+        if schema is not None:
+            return schema
+        fingerprint = schema_fingerprint({type_name: desc})
+        versions = self.versions.setdefault(type_name, {})
+        schema = versions.get(fingerprint)
+        if schema is None:
+            schema = Schema(schema_fixup(type_name, desc), fingerprint)
+            if type_name == "cpu":
+                schema.column_indices(CPU_TOTAL_KEYS)
+            versions[fingerprint] = schema
+            if len(versions) > 1:
+                logging.info("schema version %s registered for type `%s', "
+                             "%d versions known", fingerprint, type_name,
+                             len(versions))
+        self._by_desc[(type_name, desc)] = schema
+        return schema
 
-    def set_not_first_file(self, new_bool):
+SCHEMA_REGISTRY = SchemaRegistry()
+# shared by every SimpleTaccParser so each schema version is only
+# built once per run
 
-        """
-        Mutates the instance variable self.set_reboot_between_files_bool, used
-        to signify that the file being read is no longer the first file
-        """
 
-        self.not_first_file = new_bool
+class MaintainState(object):
+
+    """
+    Used to store data in between instances of the SimpleTaccParser. The dict
+    self.last_cpu_total_vals stores the last total cpu timing of each device.
+    self.last_iowait_vals holds the last iowait value of each device of the
+    previous file and is None until a file has been read.
+    self.all_reboot_intervals collects the RebootInterval of every reboot
+    found, the way self.all_error_dict collects the errors, and
+    self.all_gap_intervals the GapInterval found by find_time_gaps.
+    self.file_timestamps holds (hostname, filename, timestamps) for every
+    file read, the input of find_time_gaps.
+    """
+
+    def __init__(self):
+        self.last_cpu_total_vals = {}
+        self.last_iowait_vals = None
+        self.previous_cpu_total_time_list = 0
+        self.all_error_dict = {}
+        self.all_reboot_intervals = []
+        self.all_gap_intervals = []
+        self.file_timestamps = []
+        self.previous_timestamp = 0
+        self.gap_threshold = DEFAULT_GAP_THRESHOLD
 
-    def set_reboot_data_filename(self, name_string):
+    def set_last_cpu_total_vals(self, a_dict):
 
         """
-        Mutates the instance variable self.set_reboot_data_filename, used to
-        store the filename between instances so multiple different files are
-        not created
+        Mutates the instance variable self.last_cpu_total_vals, used to store
+        total cpu timing data from a previous instance of SimpleTaccParser
         """
 
-        self.reboot_data_filename = name_string
+        self.last_cpu_total_vals = a_dict
 
-    def set_file_created(self, new_bool):
+    def set_last_iowait_vals(self, a_dict):
 
         """
-        Mutates the instance variable self.file_created, used to check if a
-        file have been created
+        Mutates the instance variable self.last_iowait_vals, used to store
+        the last iowait values from a previous instance of SimpleTaccParser
         """
 
-        self.file_created = new_bool
+        self.last_iowait_vals = a_dict
 
     def set_previous_timestamp(self, new_timestamp):
 
@@ -281,23 +367,24 @@ class MaintainState(object):
 
         self.previous_timestamp = new_timestamp
 
-    def set_previous_filename(self, new_filename):
+    def set_gap_threshold(self, seconds):
 
         """
-        Mutates the instance variable self.previous_filename, used to store a
-        previous filename for logging purposes
+        Mutates the instance variable self.gap_threshold, the number of
+        seconds between two samples above which they are a time gap
         """
 
-        self.previous_filename = new_filename
+        self.gap_threshold = seconds
 
-    def set_time_gap_data(self, gap_data):
+    def add_file_timestamps(self, hostname, filename, timestamps):
 
         """
-        Mutates the isntance variable self.time_gap_data, this string holds all
-        the useful data to be logged
+        Appends the numpy array of a file's sample timestamps to
+        self.file_timestamps
         """
 
-        self.time_gap_data = gap_data
+        self.file_timestamps.append((hostname, filename, timestamps))
+
 
 MAINTAIN_STATE = MaintainState()
 # global variable so the values stored can be
@@ -316,23 +403,28 @@ class SimpleTaccParser(object):
     instead logged to their own file with a timestamp. Reboots are found by
     adding all cpu timings together and comparing the current sum to the
     previous and checking for drops between one timestamp to the next for each
-    device. Checks for reboots and iowait drops in between files.
+    device. Checks for reboots and iowait drops in between files. The
+    MaintainState instance carrying data between files defaults to
+    MAINTAIN_STATE, each watched host passes its own.
     """
 
-    def __init__(self):
+    def __init__(self, maintain_state=None):
 
+        self.maintain_state = maintain_state or MAINTAIN_STATE
         self.procdump = None
         self.file_schemas = {}
 
         self.reboot_flag = False  # used to prevent check_lists_for_discrepencies from incorrectly reporting errors
         self.device_potential_reboot_counter = 0
-        self.first_device_counter = 0
+        self.potential_reboot_timestamp = None
 
         self.dict_of_cpu_total_timings = {}
         self.error_dict = {}
+        self.reboot_intervals = []
         self.dict_of_iowait_lists = {}
-        self.last_cpu_total_vals = []
+        self.last_cpu_total_vals = {}
         self.list_of_timestamps = []
+        self.first_body_line = None
 
         self.raw_stats = {}
         self.marks = {}
@@ -359,32 +451,42 @@ class SimpleTaccParser(object):
         logging.error(fmt % args)
 
     def get_schema(self, type_name, desc=None):
+
+        """
+        Returns this file's schema for type_name. When desc is given the
+        schema is looked up in SCHEMA_REGISTRY; a type already described
+        differently earlier in the same header keeps its first schema and
+        is recorded in self.mismatch_schemas.
+        """
+
         schema = self.schemas.get(type_name)
-        if schema:
-            if desc and schema.desc != schema_fixup(type_name, desc):
-                # ...
-                return None
-        elif desc:
-            desc = schema_fixup(type_name, desc)
-            schema = self.schemas[type_name] = Schema(desc)
+        if desc:
+            registered = SCHEMA_REGISTRY.get(type_name, desc)
+            if schema is None:
+                schema = self.schemas[type_name] = registered
+            elif schema is not registered:
+                self.mismatch_schemas[type_name] = 1
         return schema
-    
+
     
     def read_stats_file_header(self, filepath):
+
+        """
+        Reads the schema and property lines at the top of filepath and
+        returns the file's schemas. The line ending the header, normally the
+        first timestamp, is kept in self.first_body_line for the body.
+        """
+
         file_schemas = {}
+        self.first_body_line = None
         for line in filepath:
             self.fileline += 1
             try:
                 char = line[0]
                 if char == SF_SCHEMA_CHAR:
                     type_name, schema_desc = line[1:].split(None, 1)
-                    schema = self.get_schema(type_name, schema_desc)
-                    if schema:
-                        file_schemas[type_name] = schema
-                    else:
-                        self.mismatch_schemas[type_name] = 1
-                        # self.error("file `%s', type `%s', schema mismatch desc \
-                        # `%s'", filepath.name, type_name, schema_desc)
+                    file_schemas[type_name] = self.get_schema(type_name,
+                                                              schema_desc)
                 elif char == SF_PROPERTY_CHAR:
                     if line.startswith("$tacc_stats"):
                         self.tacc_version = line.split(" ")[1].strip()
@@ -393,6 +495,7 @@ class SimpleTaccParser(object):
                 elif char == SF_COMMENT_CHAR:
                     pass
                 else:
+                    self.first_body_line = line
                     break
             except Exception as exc:
                 self.error("file `%s', caught `%s' discarding line `%s'",
@@ -409,7 +512,12 @@ class SimpleTaccParser(object):
         self.filename = filepath.name
         self.fileline = 0
 
-        self.file_schemas = self.read_stats_file_header(filepath)
+        try:
+            self.file_schemas = self.read_stats_file_header(filepath)
+        except (IOError, EOFError, zlib.error) as read_exception:
+            self.error("file `%s' cannot be read, %s on line %s",
+                       self.filename, read_exception, self.fileline)
+            return
 
         if not self.file_schemas:
             self.error("file `%s' bad header on line %s",
@@ -417,6 +525,8 @@ class SimpleTaccParser(object):
             pass
 
         try:
+            if self.first_body_line is not None:
+                self.parse(self.first_body_line.strip())
             for line in filepath:
                     self.fileline += 1
                     self.parse(line.strip())
@@ -426,7 +536,7 @@ class SimpleTaccParser(object):
             self.error("file `%s' exception %s on line %s",
                        self.filename, str(any_exception), self.fileline)
             pass
-    
+
     
     def parse(self, line):
 
@@ -486,7 +596,8 @@ class SimpleTaccParser(object):
         Checks the specified dictionary containing iowait numbers for drops in
         iowait values. Unless a reboot is detected, inconsistencies are added
         to a new dictionary with the file name as a key and the values being a
-        list of lists containing the cpu number and timestamp.
+        list of lists containing the cpu number and the timestamp of the
+        sample the lower value was read at.
         """
 
         self.store_and_set_data()
@@ -494,20 +605,23 @@ class SimpleTaccParser(object):
 
         for key, val in any_dict.iteritems():
             iowait_nums = val
+            # lists starting with the previous file's last value are one
+            # longer than the timestamps of this file
+            carried = 1 if len(iowait_nums) > len(self.list_of_timestamps) else 0
             for num in iowait_nums:
                 counter += 1
                 if counter < len(iowait_nums) and num > iowait_nums[counter] \
                    and num is not 'flagged':
                     difference = int(num) - int(iowait_nums[counter])
                     difference_string = 'iowait difference: %s' % (difference)
-                    logging.error('Error with %s iowait numbers for %s,iowait value decreased by %s at %f', filename, key, difference, self.list_of_timestamps[counter-1])
+                    timestamp = self.list_of_timestamps[counter - carried]
+                    logging.error('Error with %s iowait numbers for %s,iowait value decreased by %s at %s', filename, key, difference, timestamp)
                     if filename not in self.error_dict:
                         self.error_dict[filename] = []
-                    timestamp = self.list_of_timestamps[counter-1]
                     self.error_dict[filename].append((key, timestamp, difference_string))
                 if counter == len(iowait_nums):
                     counter = 0
-        MAINTAIN_STATE.all_error_dict.update(self.error_dict)
+        self.maintain_state.all_error_dict.update(self.error_dict)
         return self.error_dict
 
     
@@ -516,38 +630,65 @@ class SimpleTaccParser(object):
         """
         Checks if the previous total cpu total is greater than the current, if
         that is true, flag_reboot is set to true. The value at 0 in cpu_sums is
-        removed. If all devices are found to have rebooted, a timestamp and
-        filename is written to a file for logging purposes.
+        removed. If the totals of all devices are found to have dropped at the
+        same timestamp, a reboot is recorded.
         """
 
         for key, val in any_dict.iteritems():
             if len(val) == 2:
                 if val[0] > val[1]:
+                    if self.timestamp != self.potential_reboot_timestamp:
+                        self.potential_reboot_timestamp = self.timestamp
+                        self.device_potential_reboot_counter = 0
                     self.device_potential_reboot_counter += 1
                     self.reboot_flag = True
+                    if self.device_potential_reboot_counter == \
+                       self.device_count():
+                        self.record_reboot()
+                        self.device_potential_reboot_counter = 0
                 del val[0]
-            if self.device_potential_reboot_counter is 16:
-                if not MAINTAIN_STATE.file_created:
-                    MAINTAIN_STATE.set_reboot_data_filename(generate_timestamped_txt('reboot_data'))
-                    MAINTAIN_STATE.set_file_created(True)
-                reboot_info = 'Reboot at %f for %s' % (self.timestamp,
-                                                       self.filename)
-                logging.debug(reboot_info)
-                write_reboot_data_to_txt(reboot_info, MAINTAIN_STATE.reboot_data_filename)
-                self.device_potential_reboot_counter = 0
+
+    def device_count(self):
+
+        """
+        Returns the number of cpu devices of the host, those seen so far in
+        this file or in the previous file, whichever is larger
+        """
+
+        return max(len(self.dict_of_cpu_total_timings),
+                   len(self.maintain_state.last_cpu_total_vals))
+
+    def record_reboot(self):
+
+        """
+        Records a reboot found at the current timestamp as a RebootInterval
+        starting at the sample before it, which is the last sample of the
+        previous file when the reboot happened between files
+        """
+
+        position = self.list_of_timestamps.index(self.timestamp)
+        if position > 0:
+            start = self.list_of_timestamps[position - 1]
+        else:
+            start = self.maintain_state.previous_timestamp or None
+        interval = RebootInterval(self.hostname, start, self.timestamp,
+                                  self.filename)
+        logging.debug('Reboot at %s for %s', self.timestamp, self.filename)
+        self.reboot_intervals.append(interval)
+        self.maintain_state.all_reboot_intervals.append(interval)
 
     
     def extract_last_cpu_total_vals(self, cpu_timings_dict):
 
         """
-        Takes values from the arg cpu_timings_dict and puts them into a list
-        for further processing and storage
+        Takes values from the arg cpu_timings_dict and puts them into a dict
+        keyed by device for further processing and storage
         """
 
-        self.last_cpu_total_vals = []
+        self.last_cpu_total_vals = {}
         for key in cpu_timings_dict:
             try:
-                self.last_cpu_total_vals.insert(0, cpu_timings_dict[key][0])
+                self.last_cpu_total_vals[key] = cpu_timings_dict[key][0]
             except IndexError as e:
                 logging.error('%s: Cannot extract last cpu totals for file %s line %s', e, self.filename, self.fileline)
                 pass
@@ -558,7 +699,8 @@ class SimpleTaccParser(object):
         Calculates the sum of all cpu counters
         """
           
-        cpu_timings = numpy_array[[0,1,2,3,4,5,6]]
+        cpu_timings = numpy_array[
+            self.file_schemas['cpu'].column_indices(CPU_TOTAL_KEYS)]
         return int(numpy.sum(cpu_timings))
 
     def populate(self, device_name):
@@ -611,52 +753,39 @@ class SimpleTaccParser(object):
                 return
 
             device_name = 'cpu%s' % (dev_name)
-            get_schema = self.get_schema(type_name)
 
             if type_name == "cpu":
-                self.populate(device_name)
+                self.process_cpu_values(device_name, vals)
 
-                cpu_total = self.cpu_numpy_sum(vals)
+    def process_cpu_values(self, device_name, vals):
 
-                if MAINTAIN_STATE.not_first_file and self.first_device_counter < len(self.dict_of_iowait_lists):
-                    self.dict_of_cpu_total_timings[device_name].append(MAINTAIN_STATE.last_cpu_total_vals[0])
-                    del MAINTAIN_STATE.last_cpu_total_vals[0]
-                    self.first_device_counter += 1
+        """
+        Stores the iowait value and cpu total timing of one cpu record, held
+        in the numpy array vals, checking for reboots and flagging the iowait
+        value when one is found. Puts the device's last cpu total timing of
+        the previous file in front of its first one in this file.
+        """
 
-                self.dict_of_cpu_total_timings[device_name].append(cpu_total)
-                self.check_for_reboot(self.dict_of_cpu_total_timings)
+        self.populate(device_name)
 
-                if self.reboot_flag:
-                    self.dict_of_iowait_lists[device_name].append('flagged')
-                    self.reboot_flag = False
+        cpu_total = self.cpu_numpy_sum(vals)
 
-                else:
-                    iowait_val = vals[self.get_schema(type_name)['iowait'].index]
-                    self.dict_of_iowait_lists[device_name].append(iowait_val)
+        if not self.dict_of_cpu_total_timings[device_name] and \
+           device_name in self.maintain_state.last_cpu_total_vals:
+            self.dict_of_cpu_total_timings[device_name].append(
+                self.maintain_state.last_cpu_total_vals[device_name])
 
-    @staticmethod
-    def check_for_time_gap_between_files(time_gap, first_timestamp, previous_file_last_timestamp, filename):
+        self.dict_of_cpu_total_timings[device_name].append(cpu_total)
+        self.check_for_reboot(self.dict_of_cpu_total_timings)
 
-        """
-        Takes in four arguments, previous_file_last_timestamp is the last
-        timestamp of the previous file, first_timestamp is the first timestamp
-        of the current file, time_gap is the amount of time that will be
-        allowed before an error is returned, and filename is used for logging
-        purposes. Used to tell if there is a certain gap in time between the
-        previous stats file and the current stats file and if that is the case,
-        a string used in logging is returned.
-        """
+        if self.reboot_flag:
+            self.dict_of_iowait_lists[device_name].append('flagged')
+            self.reboot_flag = False
+
+        else:
+            iowait_val = vals[self.file_schemas['cpu']['iowait'].index]
+            self.dict_of_iowait_lists[device_name].append(iowait_val)
 
-        if MAINTAIN_STATE.previous_timestamp is not 0:
-            try:
-                difference = int(first_timestamp) - int(previous_file_last_timestamp)
-                if difference > time_gap:
-                    gap_in_minutes = int(difference / 60)
-                    return "%s minute gap starting at %s beginning in file %s" % (gap_in_minutes, MAINTAIN_STATE.previous_timestamp, filename)
-            except TypeError as e:
-                logging.error('%s: Couldn\'t check for time gap for file %s', e, filename)
-                pass
-            
     @property
     def get_dict_of_iowait_lists(self):
 
@@ -709,11 +838,11 @@ class SimpleTaccParser(object):
         """
         try:
             self.extract_last_cpu_total_vals(self.dict_of_cpu_total_timings)
-            if MAINTAIN_STATE.not_first_file:
-                time_gap_data = self.check_for_time_gap_between_files(self.list_of_timestamps[0], MAINTAIN_STATE.previous_timestamp, 1200, MAINTAIN_STATE.previous_filename)
-                MAINTAIN_STATE.set_time_gap_data(time_gap_data)
-            MAINTAIN_STATE.set_previous_timestamp(self.timestamp)
-            MAINTAIN_STATE.set_previous_filename(self.filename)
+            self.maintain_state.add_file_timestamps(
+                self.hostname, self.filename,
+                numpy.array([timestamp for timestamp in self.list_of_timestamps
+                             if timestamp is not None], dtype=numpy.float64))
+            self.maintain_state.set_previous_timestamp(self.timestamp)
 
         except IndexError as e:
             if len(self.dict_of_cpu_total_timings) == 0 and len(self.list_of_timestamps) == 0:
@@ -724,15 +853,609 @@ class SimpleTaccParser(object):
                 logging.error('%s: ist_of_timestamps empty for file %s', e, self.filename)
             pass
 
+class BlockFormatError(ValueError):
+
+    """
+    Raised when a StatsBlock cannot be parsed in bulk. Callers fall back to
+    reading the file line by line, which handles every malformed case.
+    """
+
+
+class StatsBlock(object):
+
+    """
+    A whole decompressed tacc stats file held in one buffer, the string
+    read from a '.gz' file. Line and field boundaries are found with numpy
+    over a uint8 view of the buffer, and the numeric fields of every record
+    of a type are converted into a single numpy array at once, so no
+    per-line string objects are created for the data records. Only the few
+    header lines are handed out as strings, by iterating over the block.
+    """
+
+    def __init__(self, name, data):
+
+        self.name = name
+        self.data = data
+        self.buf = numpy.frombuffer(data, dtype=numpy.uint8)
+
+        line_ends = numpy.flatnonzero(self.buf == NEWLINE_BYTE)
+        if len(self.buf) and self.buf[-1] != NEWLINE_BYTE:
+            line_ends = numpy.append(line_ends, len(self.buf))
+        self.line_ends = line_ends
+        self.line_starts = numpy.concatenate(([0], line_ends[:-1] + 1))
+        self.line_count = len(line_ends)
+
+        first_chars = numpy.empty(self.line_count, dtype=numpy.uint8)
+        first_chars.fill(NEWLINE_BYTE)
+        non_empty = self.line_starts < self.line_ends
+        first_chars[non_empty] = self.buf[self.line_starts[non_empty]]
+        self.first_chars = first_chars
+
+        # read_stats_file_header stops at, and consumes, the first line that
+        # is not a schema, property or comment line
+        is_header = (first_chars == ord(SF_SCHEMA_CHAR)) | \
+                    (first_chars == ord(SF_PROPERTY_CHAR)) | \
+                    (first_chars == ord(SF_COMMENT_CHAR))
+        not_header = numpy.flatnonzero(~is_header)
+        self.header_end = not_header[0] if len(not_header) \
+            else self.line_count
+
+    def __iter__(self):
+
+        """
+        Yields the header lines, and the line ending the header, as strings
+        """
+
+        for index in xrange(min(self.header_end + 1, self.line_count)):
+            yield self.data[self.line_starts[index]:self.line_ends[index] + 1]
+
+    def _byte_mask(self, offset, size, starts, ends):
+
+        """
+        Returns a boolean mask over the size bytes of the buffer starting at
+        offset, selecting the byte ranges [start, end) for every pair of
+        starts and ends, which are buffer positions inside that span
+        """
+
+        delta = numpy.zeros(size + 1, dtype=numpy.int32)
+        numpy.add.at(delta, starts - offset, 1)
+        numpy.add.at(delta, ends - offset, -1)
+        return numpy.cumsum(delta[:-1], dtype=numpy.int32) > 0
+
+    def _line_chunks(self, first_line):
+
+        """
+        Yields (first, last) line index ranges splitting the lines from
+        first_line on into chunks of whole lines holding about
+        BLOCK_CHUNK_BYTES bytes each, so the per byte work of records needs
+        memory in proportion to a chunk instead of the whole buffer
+        """
+
+        line = first_line
+        while line < self.line_count:
+            limit = self.line_starts[line] + BLOCK_CHUNK_BYTES
+            last = max(line + 1, numpy.searchsorted(self.line_ends, limit))
+            yield line, min(last, self.line_count)
+            line = last
+
+    def _timestamps(self, starts, ends):
+
+        """
+        Returns the float values of the first fields of the lines between
+        starts and ends
+        """
+
+        if not len(starts):
+            return numpy.zeros(0, dtype=numpy.float64)
+        offset = starts[0]
+        size = min(ends[-1] + 1, len(self.buf)) - offset
+        chunk = self.buf[offset:offset + size]
+        whitespace_positions = numpy.append(
+            numpy.flatnonzero(chunk <= ord(' ')), size - 1) + offset
+        field_ends = whitespace_positions[
+            numpy.searchsorted(whitespace_positions, starts)]
+        timestamp_bytes = chunk[self._byte_mask(offset, size, starts,
+                                                field_ends + 1)]
+        return numpy.fromstring(timestamp_bytes.tostring(),
+                                dtype=numpy.float64, sep=' ')
+
+    def _fields(self, field_starts, field_ends, width, lines, type_name):
+
+        """
+        Converts the numbers between field_starts and field_ends of the
+        records of type_name on lines. Returns the lines kept and a uint64
+        array of their numbers of shape (records, width + 1). Only the bytes
+        of those ranges are looked at.
+        """
+
+        numbers = numpy.zeros(0, dtype=numpy.uint64)
+        if not len(lines):
+            return lines, numbers.reshape(-1, width + 1)
+        offset = field_starts[0]
+        size = field_ends[-1] - offset
+        field_bytes = self.buf[offset:offset + size][
+            self._byte_mask(offset, size, field_starts, field_ends)]
+        lengths = field_ends - field_starts
+        field_offsets = numpy.concatenate(([0], numpy.cumsum(lengths)))
+
+        # count the numbers and any stray characters on every line; a number
+        # starts at every digit not preceded by one on the same line
+        is_digit = (field_bytes - ord('0')) < 10
+        token_start = is_digit.copy()
+        token_start[1:] &= ~is_digit[:-1]
+        segment_starts = field_offsets[:-1][lengths > 0]
+        token_start[segment_starts] = is_digit[segment_starts]
+        stray = ~(is_digit | (field_bytes <= ord(' ')))
+        token_count = numpy.concatenate(
+            ([0], numpy.cumsum(token_start, dtype=numpy.int32)))
+        stray_count = numpy.concatenate(
+            ([0], numpy.cumsum(stray, dtype=numpy.int32)))
+        tokens = numpy.diff(token_count[field_offsets])
+        strays = numpy.diff(stray_count[field_offsets])
+        del stray, token_count, stray_count
+        valid = (tokens == width + 1) & (strays == 0)
+        for index in numpy.flatnonzero(~valid):
+            logging.error("file `%s', type `%s', expected %d values, read %d,"
+                          " discarding line `%s'", self.name, type_name,
+                          width, tokens[index] - 1, lines[index] + 1)
+
+        # convert every number of the valid lines at once: each digit is
+        # scaled by its power of ten and the digits of a number are summed
+        digit_positions = numpy.flatnonzero(
+            numpy.repeat(valid, lengths) & is_digit)
+        if len(digit_positions):
+            number_starts = numpy.flatnonzero(token_start[digit_positions])
+            number_ends = numpy.append(number_starts[1:],
+                                       len(digit_positions))
+            digit_lengths = number_ends - number_starts
+            if digit_lengths.max() > len(POWERS_OF_TEN):
+                raise BlockFormatError('number too large')
+            exponents = numpy.repeat(number_ends - 1, digit_lengths) - \
+                numpy.arange(len(digit_positions))
+            digits = (field_bytes[digit_positions] - ord('0')).astype(
+                numpy.uint64)
+            numbers = numpy.add.reduceat(digits * POWERS_OF_TEN[exponents],
+                                         number_starts)
+        return lines[valid], numbers.reshape(-1, width + 1)
+
+    def records(self, type_name, width):
+
+        """
+        Parses every record of type_name with width values in the body of
+        the block. Returns a tuple of
+            timestamps: float array of the body's timestamp lines
+            row_timestamp_index: for each record, the index in timestamps
+                of the timestamp it follows, or -1 if there is none
+            row_lines: the zero based line number of each record
+            devices: uint64 array of the device number of each record
+            values: uint64 array of shape (records, width)
+        Records with the wrong number of values or stray characters are
+        discarded and logged, like processdata does. The body is parsed in
+        chunks of whole lines, see _line_chunks.
+        """
+
+        buf = self.buf
+        prefix = type_name + ' '
+        last_byte = len(buf) - 1
+        timestamp_parts = []
+        timestamp_line_parts = []
+        typed_line_parts = []
+        number_parts = []
+        for first, last in self._line_chunks(self.header_end):
+            starts = self.line_starts[first:last]
+            ends = self.line_ends[first:last]
+            first_chars = self.first_chars[first:last]
+            if numpy.any(buf[starts[starts < ends]] <= ord(' ')):
+                raise BlockFormatError('line with leading whitespace')
+
+            # timestamp lines, only their first field is used
+            timestamp_lines = numpy.flatnonzero((first_chars - ord('0')) < 10)
+            timestamps = self._timestamps(starts[timestamp_lines],
+                                          ends[timestamp_lines])
+            if len(timestamps) != len(timestamp_lines):
+                raise BlockFormatError('malformed timestamp line')
+            timestamp_parts.append(timestamps)
+            timestamp_line_parts.append(timestamp_lines + first)
+
+            # lines starting with "<type_name> "
+            typed = (ends - starts) >= len(prefix)
+            for offset, char in enumerate(prefix):
+                typed &= buf[numpy.minimum(starts + offset, last_byte)] == \
+                    ord(char)
+            typed_lines = numpy.flatnonzero(typed)
+            typed_lines, numbers = self._fields(
+                starts[typed_lines] + len(prefix), ends[typed_lines], width,
+                typed_lines + first, type_name)
+            typed_line_parts.append(typed_lines)
+            number_parts.append(numbers)
+
+        timestamps = numpy.concatenate(
+            [numpy.zeros(0, dtype=numpy.float64)] + timestamp_parts)
+        timestamp_lines = numpy.concatenate(
+            [numpy.zeros(0, dtype=numpy.intp)] + timestamp_line_parts)
+        typed_lines = numpy.concatenate(
+            [numpy.zeros(0, dtype=numpy.intp)] + typed_line_parts)
+        numbers = numpy.concatenate(
+            [numpy.zeros((0, width + 1), dtype=numpy.uint64)] + number_parts)
+        row_timestamp_index = numpy.searchsorted(timestamp_lines,
+                                                 typed_lines) - 1
+        return (timestamps, row_timestamp_index, typed_lines,
+                numbers[:, 0], numbers[:, 1:])
+
+
+def open_stats_block(path):
+
+    """
+    Returns a StatsBlock for a '.gz' tacc stats file, decompressed into
+    memory in one read. Of an archive that cannot be decompressed to the
+    end, the block holds the complete lines read before the error, the part
+    the reference engine reads.
+    """
+
+    with gzip.open(path) as filepath:
+        try:
+            return StatsBlock(path, filepath.read())
+        except (IOError, EOFError, zlib.error) as e:
+            logging.warning('%s: %s cannot be decompressed to the end, '
+                            'reading the lines before the error', e, path)
+        filepath.seek(0)
+        lines = []
+        try:
+            for line in filepath:
+                lines.append(line)
+        except (IOError, EOFError, zlib.error):
+            pass
+        return StatsBlock(path, ''.join(lines))
+
+
+def find_cpu_total_drops(device_index, totals, carry_values, carried):
+
+    """
+    Returns a boolean array marking the records whose cpu total is lower
+    than the previous total of the same device. device_index numbers the
+    device of every record, and carried marks the records that are compared
+    with the value in carry_values, the total carried over from the previous
+    file, instead.
+    """
+
+    order = numpy.argsort(device_index, kind='mergesort')
+    sorted_devices = device_index[order]
+    sorted_totals = totals[order]
+    sorted_drops = numpy.zeros(len(order), dtype=bool)
+    sorted_drops[1:] = (sorted_devices[1:] == sorted_devices[:-1]) & \
+        (sorted_totals[:-1] > sorted_totals[1:])
+    drops = numpy.empty(len(order), dtype=bool)
+    drops[order] = sorted_drops
+    return drops | (carried & (carry_values > totals))
+
+
+def _find_cpu_total_drops_loop(device_index, totals, carry_values, carried):
+
+    """
+    Single pass version of find_cpu_total_drops, compiled when numba is
+    installed
+    """
+
+    last_totals = numpy.zeros(device_index.max() + 1, dtype=numpy.uint64)
+    seen = numpy.zeros(device_index.max() + 1, dtype=numpy.bool_)
+    drops = numpy.zeros(len(totals), dtype=numpy.bool_)
+    for row in range(len(totals)):
+        device = device_index[row]
+        if carried[row]:
+            drops[row] = carry_values[row] > totals[row]
+        elif seen[device]:
+            drops[row] = last_totals[device] > totals[row]
+        last_totals[device] = totals[row]
+        seen[device] = True
+    return drops
+
+
+_DROP_KERNEL = []
+
+
+def get_drop_kernel():
+
+    """
+    Returns the function used to find cpu total drops. numba is only
+    imported the first time this is called, and the compiled loop is used
+    when it is installed.
+    """
+
+    if not _DROP_KERNEL:
+        try:
+            import numba
+            _DROP_KERNEL.append(numba.njit(_find_cpu_total_drops_loop))
+        except ImportError:
+            _DROP_KERNEL.append(find_cpu_total_drops)
+    return _DROP_KERNEL[0]
+
+
+class VectorizedTaccParser(SimpleTaccParser):
+
+    """
+    SimpleTaccParser whose cpu bookkeeping and discrepancy checks work on
+    whole blocks with numpy instead of record by record. It produces the
+    same dictionaries, reboot data and errors as SimpleTaccParser. Blocks
+    the record by record code would trip over, and which it would partly
+    discard, raise BlockFormatError so the caller can read the file with
+    SimpleTaccParser instead.
+    """
+
+    def __init__(self, maintain_state=None):
+
+        SimpleTaccParser.__init__(self, maintain_state)
+        self.iowait_arrays = {}
+
+    def read_stats_block(self, block):
+
+        """
+        Counterpart of read_stats_file for a StatsBlock. The header is read
+        the same way, then every cpu record of the block is handed to
+        process_cpu_block straight from the arrays built by
+        StatsBlock.records, without going through parse line by line.
+        Raises BlockFormatError, before any record is processed, if the
+        block cannot be parsed in bulk.
+        """
+
+        if self.state == DONE:
+            return
+
+        self.filename = block.name
+        self.fileline = 0
+
+        self.file_schemas = self.read_stats_file_header(block)
+
+        if not self.file_schemas:
+            self.error("file `%s' bad header on line %s",
+                       self.filename, self.fileline)
+
+        schema = self.file_schemas.get('cpu')
+        if schema is None:
+            return
+        timestamps, row_timestamp_index, row_lines, devices, values = \
+            block.records('cpu', len(schema))
+        self.process_cpu_block(timestamps.tolist(), row_timestamp_index,
+                               row_lines, devices, values)
+        self.fileline = block.line_count
+
+    def process_cpu_block(self, timestamps, row_timestamp_index, row_lines,
+                          devices, values):
+
+        """
+        Bulk counterpart of process_cpu_values for all the cpu records
+        returned by StatsBlock.records
+        """
+
+        row_count = len(devices)
+        if row_count == 0:
+            if len(timestamps):
+                self.timestamp = timestamps[-1]
+            return
+
+        # devices numbered in order of first appearance, like populate
+        unique_devices, first_rows, device_index = numpy.unique(
+            devices, return_index=True, return_inverse=True)
+        appearance = numpy.argsort(first_rows)
+        rank = numpy.empty(len(appearance), dtype=numpy.intp)
+        rank[appearance] = numpy.arange(len(appearance))
+        device_index = rank[device_index]
+        first_rows = first_rows[appearance]
+        device_names = ['cpu%d' % device
+                        for device in unique_devices[appearance]]
+
+        # the first record of every device takes the cpu total the previous
+        # file ended with for that device
+        last_totals = self.maintain_state.last_cpu_total_vals
+        carried = numpy.zeros(row_count, dtype=bool)
+        carry_values = numpy.zeros(row_count, dtype=numpy.uint64)
+        for row, device_name in zip(first_rows, device_names):
+            if device_name in last_totals:
+                carried[row] = True
+                carry_values[row] = last_totals[device_name]
+
+        schema = self.file_schemas['cpu']
+        totals = values[:, schema.column_indices(CPU_TOTAL_KEYS)].sum(
+            axis=1, dtype=numpy.uint64)
+        drops = get_drop_kernel()(device_index, totals, carry_values, carried)
+
+        # drops are rare, so reboots are counted the way check_for_reboot
+        # does, drop by drop
+        row_timestamps = [timestamps[index] if index >= 0 else self.timestamp
+                          for index in row_timestamp_index.tolist()]
+        reboot_rows = []
+        for row in numpy.flatnonzero(drops).tolist():
+            if row_timestamps[row] != self.potential_reboot_timestamp:
+                self.potential_reboot_timestamp = row_timestamps[row]
+                self.device_potential_reboot_counter = 0
+            self.device_potential_reboot_counter += 1
+            device_count = max(numpy.searchsorted(first_rows, row, 'right'),
+                               len(last_totals))
+            if self.device_potential_reboot_counter == device_count:
+                reboot_rows.append(row)
+                self.device_potential_reboot_counter = 0
+
+        seen_timestamps = set(self.list_of_timestamps)
+        for index in numpy.unique(row_timestamp_index):
+            timestamp = timestamps[index] if index >= 0 else self.timestamp
+            if timestamp not in seen_timestamps:
+                seen_timestamps.add(timestamp)
+                self.list_of_timestamps.append(timestamp)
+
+        for row in reboot_rows:
+            self.timestamp = row_timestamps[row]
+            self.fileline = row_lines[row] + 1
+            self.record_reboot()
+
+        iowait_index = schema['iowait'].index
+        iowait = values[:, iowait_index]
+        order = numpy.argsort(device_index, kind='mergesort')
+        boundaries = numpy.searchsorted(device_index[order],
+                                        numpy.arange(len(device_names) + 1))
+        for device, device_name in enumerate(device_names):
+            rows = order[boundaries[device]:boundaries[device + 1]]
+            flagged = drops[rows]
+            self.iowait_arrays[device_name] = (iowait[rows], flagged)
+            iowait_list = iowait[rows].tolist()
+            for position in numpy.flatnonzero(flagged):
+                iowait_list[position] = 'flagged'
+            self.dict_of_iowait_lists[device_name] = iowait_list
+            self.dict_of_cpu_total_timings[device_name] = \
+                [int(totals[rows[-1]])]
+
+        if len(timestamps):
+            self.timestamp = timestamps[-1]
+
+    def check_lists_for_discrepencies(self, any_dict, filename):
+
+        """
+        Bulk counterpart of SimpleTaccParser.check_lists_for_discrepencies.
+        Uses the iowait arrays kept by process_cpu_block, plus the value
+        append_last_vals may have put in front of each list.
+        """
+
+        for key, val in any_dict.iteritems():
+            if key not in self.iowait_arrays or \
+               len(val) - len(self.iowait_arrays[key][0]) not in (0, 1) or \
+               len(val) > len(self.list_of_timestamps) + 1:
+                return SimpleTaccParser.check_lists_for_discrepencies(
+                    self, any_dict, filename)
+
+        self.store_and_set_data()
+
+        for key, val in any_dict.iteritems():
+            iowait, flagged = self.iowait_arrays[key]
+            carried = 1 if len(val) > len(self.list_of_timestamps) else 0
+            if len(val) == len(iowait) + 1:
+                first = val[0]
+                iowait = numpy.concatenate((numpy.zeros(1, numpy.uint64),
+                                            iowait))
+                flagged = numpy.concatenate(([first is 'flagged'], flagged))
+                if not flagged[0]:
+                    iowait[0] = first
+            drops = numpy.flatnonzero((iowait[:-1] > iowait[1:]) &
+                                      ~flagged[:-1] & ~flagged[1:])
+            for position in drops:
+                difference = int(iowait[position]) - int(iowait[position + 1])
+                difference_string = 'iowait difference: %s' % (difference)
+                timestamp = self.list_of_timestamps[position + 1 - carried]
+                logging.error('Error with %s iowait numbers for %s,iowait value decreased by %s at %s', filename, key, difference, timestamp)
+                if filename not in self.error_dict:
+                    self.error_dict[filename] = []
+                self.error_dict[filename].append((key, timestamp, difference_string))
+        self.maintain_state.all_error_dict.update(self.error_dict)
+        return self.error_dict
+
+
+class PythonBackend(object):
+
+    """
+    Reference engine, reads files line by line with SimpleTaccParser
+    """
+
+    name = 'python'
+
+    def read_file(self, afile, filepath, maintain_state):
+
+        """
+        Reads the open file filepath and returns the parser holding its data
+        """
+
+        stp = SimpleTaccParser(maintain_state)
+        stp.read_stats_file(filepath)
+        return stp
+
+
+class NumpyBackend(PythonBackend):
+
+    """
+    Fast engine, reads files as a StatsBlock with VectorizedTaccParser and
+    falls back to the reference engine for files it cannot handle in bulk,
+    including archives that cannot be decompressed to the end, of which
+    the reference engine reads as much as it can
+    """
+
+    name = 'numpy'
+
+    def read_file(self, afile, filepath, maintain_state):
+
+        """
+        Reads the open file filepath and returns the parser holding its data
+        """
+
+        stp = VectorizedTaccParser(maintain_state)
+        try:
+            stp.read_stats_block(StatsBlock(afile, filepath.read()))
+        except (BlockFormatError, IOError, EOFError, zlib.error) as e:
+            logging.warning('%s: Cannot read %s as a block, reading it line '
+                            'by line', e, afile)
+            filepath.seek(0)
+            stp = PythonBackend.read_file(self, afile, filepath,
+                                          maintain_state)
+        return stp
+
+
+BACKENDS = {
+    PythonBackend.name: PythonBackend(),
+    NumpyBackend.name: NumpyBackend()
+}
+
+
+def check_backend_conformance(path, backend_names=('python', 'numpy')):
+
+    """
+    Reads every '.gz' file in path with each backend and compares the error
+    dictionaries, the text reports and the reboot data they produce.
+    Returns True if all backends agree.
+    """
+
+    scratch = tempfile.mkdtemp(prefix='backend_conformance_')
+    outputs = []
+    try:
+        for name in backend_names:
+            maintain_state = MaintainState()
+            report = TextReport(
+                os.path.join(scratch, 'dict_text_%s.txt' % name),
+                os.path.join(scratch, 'reboot_data_%s.jsonl' % name))
+            for afile in sorted(get_list_of_files_in_directory(path)):
+                process_gz_file(afile, report, maintain_state,
+                                BACKENDS[name])
+            report.close()
+            with open(report.dict_text_filename) as afile:
+                dict_text = afile.read()
+            outputs.append((maintain_state.all_error_dict, dict_text,
+                            maintain_state.all_reboot_intervals))
+    finally:
+        shutil.rmtree(scratch)
+
+    conforms = True
+    for name, output in zip(backend_names[1:], outputs[1:]):
+        for label, reference, result in zip(
+                ('error_dict', 'text report', 'reboot data'),
+                outputs[0], output):
+            if reference != result:
+                logging.error('%s backend %s differs from %s backend', name,
+                              label, backend_names[0])
+                conforms = False
+    return conforms
+
+
 class SqlInsert(object):
 
+    """
+    Inserts error dictionaries into the central MySQL database. MySQLdb is
+    only imported once an instance is created, so runs that do not write to
+    MySQL neither need the driver nor pay for loading it.
+    """
+
     def __init__(self, host, user, password, database):
 
+        import MySQLdb
+
         self.host = host
         self.user = user
         self.password = password
         self.database = database
-        self.con = mdb.connect(host=host, user=user, passwd=password, db=database)
+        self.con = MySQLdb.connect(host=host, user=user, passwd=password, db=database)
 
 
     def insert(self, hostname, device_name, timestamp, discrepency, discrepency_type):
@@ -758,20 +1481,27 @@ class SqlInsert(object):
         cur.execute(data_errors_query, [hostname, discrepency_type, timestamp, discrepency, device_name])
 
 
-    def recursive_insert(self, error_dict):
+    def recursive_insert(self, error_dict, hostname=None):
 
         """
-        Loops through the error dictionary and inserts into the sql tables for each tuple in the error dictionary
+        Loops through the error dictionary and inserts into the sql tables for each tuple in the error dictionary.
+        hostname is the $hostname of the file header; without it the host is taken from the file path.
         """
 
         for key, val in error_dict.iteritems():
-            hostname = re.search(r"(\w+-\w+.stampede.tacc.utexas.edu)", key).group(1)
+            host = hostname
+            if host is None:
+                hostname_regex = HOSTNAME_REGEX.search(key)
+                if hostname_regex is None:
+                    logging.warning('No hostname for %s, not storing its %d discrepancies', key, len(val))
+                    continue
+                host = hostname_regex.group(1)
             for dict_tuple in val:
                 device_name = dict_tuple[0]
                 timestamp = dict_tuple[1]
                 discrepency_type = re.search("(.+): \d+", dict_tuple[2]).group(1)
                 discrepency = re.search("iowait difference: (\d+)", dict_tuple[2]).group(1)
-                self.insert(hostname, device_name, timestamp, discrepency, discrepency_type)
+                self.insert(host, device_name, timestamp, discrepency, discrepency_type)
                 self.postinsert()
 
     def postinsert(self):
@@ -787,121 +1517,826 @@ def extract_last_list_val(any_dict):
 
     """
     Used to read gz files as a contiguous block. Takes the last iowait values
-    from the current instance for each cpu and returns a list of those values
-    in order to read all files as a contiguous block
+    from the current instance for each cpu and returns a dict of those values
+    keyed by cpu in order to read all files as a contiguous block
     """
 
-    list_of_last_vals = []
-    for value in any_dict.values():
+    last_vals = {}
+    for key, value in any_dict.iteritems():
         try:
-            list_of_last_vals.append(value[-1])
+            last_vals[key] = value[-1]
         except IndexError as e:
             logging.error('%s: Values from last file not found, cannot extract', e)
             pass
-    return list_of_last_vals
+    return last_vals
 
 
-def append_last_vals(a_list, any_dict):
+def append_last_vals(a_dict, any_dict):
 
     """
-    Used to read gz files as a contiguous block. Takes in a list and dictionary
-    and inserts a value from a_list at an incrementing index into any_dict, one
-    value for each key
+    Used to read gz files as a contiguous block. Takes in two dictionaries
+    and inserts the value a_dict holds for each key of any_dict at the front
+    of its list. Keys missing from a_dict are left alone.
     """
-    try:    
-        incrementer = 0
-        for key in any_dict:
-            any_dict[key].insert(0, a_list[incrementer])
-            incrementer += 1
-    except IndexError as e:
-        logging.error('%s: Values from last file not found, cannot append', e)
-        pass
 
-def generate_timestamped_txt(text_type):
+    for key in any_dict:
+        if key in a_dict:
+            any_dict[key].insert(0, a_dict[key])
+
+def generate_timestamped_txt(text_type, extension='txt'):
 
     """
-    Creates a text file which has a timestamp in the name and takes in a type
+    Returns a file name which has a timestamp in the name and takes in a type
     of file
     """
 
     timestamp = datetime.datetime.now().strftime('%Y-%m-%d_%H:%M:%S')
-    full_filename = '%s_%s.txt' % (text_type, timestamp)
-    os.mknod(full_filename)
-    return full_filename
+    return '%s_%s.%s' % (text_type, timestamp, extension)
 
 
-def write_reboot_data_to_txt(reboot_info, filename):
+class TextReport(object):
 
     """
-    Takes in the string from check_for_reboot and appends it into a file named
-    'reboot_data', logs reboot data.
+    Buffered sink for the text report of errors and for the reboot and time
+    gap data. Each file is opened once per run and records are written out
+    in batches of batch_size lines. Reboots and gaps are written as JSON
+    Lines, one RebootInterval or GapInterval object (host, start, end,
+    filename) per line, and their files are only created once the first
+    one is found.
     """
 
-    with open(filename, 'a') as rfile:
-        rfile.write(reboot_info)
-        rfile.write('\n')
+    def __init__(self, dict_text_filename=None, reboot_data_filename=None,
+                 batch_size=1000, gap_data_filename=None):
+
+        self.dict_text_filename = dict_text_filename or \
+            generate_timestamped_txt('dict_text')
+        self.reboot_data_filename = reboot_data_filename or \
+            generate_timestamped_txt('reboot_data', 'jsonl')
+        self.gap_data_filename = gap_data_filename or \
+            generate_timestamped_txt('gap_data', 'jsonl')
+        self.batch_size = batch_size
+        self.dict_text = open(self.dict_text_filename, 'a')
+        self.reboot_data = None
+        self.gap_data = None
+        self.hostnames_written = set()
+        self.pending_dict_text = []
+        self.pending_reboot_data = []
+        self.pending_gap_data = []
+
+    def write_errors(self, any_dict, hostname=None):
+
+        """
+        Queues an error dictionary. Each hostname is written once, before
+        its first errors.
+        """
+
+        for filename, onelist in any_dict.iteritems():
+            hostname_regex = HOSTNAME_REGEX.search(filename)
+            if hostname_regex is not None and hostname_regex.group() not in self.hostnames_written:
+                self.hostnames_written.add(hostname_regex.group())
+                self.pending_dict_text.append(hostname_regex.group() + '\n')
+            easier_read_format = '%s ---> %s\n' % (filename, onelist)
+            self.pending_dict_text.append(easier_read_format)
+        if len(self.pending_dict_text) >= self.batch_size:
+            self.flush()
+
+    def write_reboots(self, intervals):
+
+        """
+        Queues a list of RebootInterval
+        """
+
+        for interval in intervals:
+            self.pending_reboot_data.append(
+                json.dumps(interval._asdict()) + '\n')
+        if len(self.pending_reboot_data) >= self.batch_size:
+            self.flush()
+
+    def write_gaps(self, intervals):
+
+        """
+        Queues a list of GapInterval
+        """
 
+        for interval in intervals:
+            self.pending_gap_data.append(
+                json.dumps(interval._asdict()) + '\n')
+        if len(self.pending_gap_data) >= self.batch_size:
+            self.flush()
 
-def write_dict_to_txt(any_dict, dict_text_filename):
+    def flush(self):
+
+        """
+        Writes out everything queued so far
+        """
+
+        if self.pending_dict_text:
+            self.dict_text.writelines(self.pending_dict_text)
+            self.pending_dict_text = []
+        self.dict_text.flush()
+        if self.pending_reboot_data:
+            if self.reboot_data is None:
+                self.reboot_data = open(self.reboot_data_filename, 'a')
+            self.reboot_data.writelines(self.pending_reboot_data)
+            self.pending_reboot_data = []
+            self.reboot_data.flush()
+        if self.pending_gap_data:
+            if self.gap_data is None:
+                self.gap_data = open(self.gap_data_filename, 'a')
+            self.gap_data.writelines(self.pending_gap_data)
+            self.pending_gap_data = []
+            self.gap_data.flush()
+
+    def close(self):
+        self.flush()
+        self.dict_text.close()
+        if self.reboot_data is not None:
+            self.reboot_data.close()
+        if self.gap_data is not None:
+            self.gap_data.close()
+
+
+class JsonLinesReport(object):
 
     """
-    Writes inputed dictionary into a text file. Used to write errors to a file.
+    Sink writing every discrepancy, reboot and time gap as one JSON object
+    per line to a single file, each with a kind of 'discrepancy', 'reboot'
+    or 'gap', written out in batches of batch_size lines
     """
 
-    with open(dict_text_filename, 'a+') as afile:
-        if MAINTAIN_STATE.time_gap_data is not None:
-            afile.write(str(MAINTAIN_STATE.time_gap_data))
+    def __init__(self, filename=None, batch_size=1000):
+
+        self.filename = filename or generate_timestamped_txt('results',
+                                                             'jsonl')
+        self.batch_size = batch_size
+        self.output = open(self.filename, 'a')
+        self.pending = []
+
+    def _queue(self, kind, record):
+        record['kind'] = kind
+        self.pending.append(json.dumps(record) + '\n')
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def write_errors(self, any_dict, hostname=None):
+        for filename, onelist in any_dict.iteritems():
+            host = hostname
+            if host is None:
+                hostname_regex = HOSTNAME_REGEX.search(filename)
+                host = hostname_regex and hostname_regex.group(1)
+            for device_name, timestamp, discrepency_string in onelist:
+                self._queue('discrepancy', {
+                    'host': host,
+                    'device': device_name,
+                    'timestamp': timestamp,
+                    'discrepency': int(discrepency_string.rsplit(' ', 1)[-1]),
+                    'filename': filename})
+
+    def write_reboots(self, intervals):
+        for interval in intervals:
+            self._queue('reboot', interval._asdict())
+
+    def write_gaps(self, intervals):
+        for interval in intervals:
+            self._queue('gap', interval._asdict())
+
+    def flush(self):
+        self.output.writelines(self.pending)
+        self.pending = []
+        self.output.flush()
+
+    def close(self):
+        self.flush()
+        self.output.close()
+
+
+class ResultsStoreReport(object):
+
+    """
+    Sink inserting into a local results_store.ResultsStore at path, the
+    default results store when it is None. The results_store module is only
+    imported when this sink is used. Rows are inserted in batches of
+    batch_size discrepancies, keyed by the hostname the parser read from
+    the file header so they match the reboots and gaps of the same host.
+    """
+
+    def __init__(self, path=None, batch_size=1000):
+
+        from results_store import ResultsStore, DEFAULT_RESULTS_DB
+
+        self.store = ResultsStore(path or DEFAULT_RESULTS_DB)
+        self.batch_size = batch_size
+        self.pending_errors = {}
+        self.pending_error_count = 0
+        self.pending_reboots = []
+        self.pending_gaps = []
+
+    def write_errors(self, any_dict, hostname=None):
+        host_errors = self.pending_errors.setdefault(hostname, {})
         for filename, onelist in any_dict.iteritems():
-            hostname_regex = re.search(r"(\w+-\w+.stampede.tacc.utexas.edu)", filename)
-            if hostname_regex is not None and hostname_regex.group() not in afile.read():
-                afile.write(hostname_regex.group())
-                afile.write('\n')
-            easier_read_format = '%s ---> %s' % (filename, onelist)
-            afile.write(easier_read_format)
-            afile.write('\n')
+            host_errors.setdefault(filename, []).extend(onelist)
+            self.pending_error_count += len(onelist)
+        if self.pending_error_count >= self.batch_size:
+            self.flush()
+
+    def write_reboots(self, intervals):
+        self.pending_reboots.extend(intervals)
+
+    def write_gaps(self, intervals):
+        self.pending_gaps.extend(intervals)
+
+    def flush(self):
+        for hostname, error_dict in self.pending_errors.iteritems():
+            self.store.insert_error_dict(error_dict, hostname)
+        self.store.insert_reboot_intervals(self.pending_reboots)
+        self.store.insert_gap_intervals(self.pending_gaps)
+        self.pending_errors = {}
+        self.pending_error_count = 0
+        self.pending_reboots = []
+        self.pending_gaps = []
+
+    def close(self):
+        self.flush()
+        self.store.close()
+
+
+class MySqlReport(object):
+
+    """
+    Sink inserting discrepancies into the central MySQL database through
+    SqlInsert. The database has no tables for reboots or time gaps, so
+    those are not written.
+    """
+
+    def __init__(self, host='localhost', user='xdtas', password='###PASS###',
+                 database='ts_analysis'):
+
+        self.sql_instance = SqlInsert(host, user, password, database)
+
+    def write_errors(self, any_dict, hostname=None):
+        self.sql_instance.recursive_insert(any_dict, hostname)
+
+    def write_reboots(self, intervals):
+        pass
+
+    def write_gaps(self, intervals):
+        pass
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.sql_instance.con.close()
+
+
+class ReportFanout(object):
+
+    """
+    Report handing everything written to it on to each of reports, the
+    sinks selected for a run. Without reports, as in a dry run, everything
+    written to it is dropped.
+    """
+
+    def __init__(self, reports):
+
+        self.reports = list(reports)
+
+    def write_errors(self, any_dict, hostname=None):
+        for report in self.reports:
+            report.write_errors(any_dict, hostname)
+
+    def write_reboots(self, intervals):
+        for report in self.reports:
+            report.write_reboots(intervals)
+
+    def write_gaps(self, intervals):
+        for report in self.reports:
+            report.write_gaps(intervals)
+
+    def flush(self):
+        for report in self.reports:
+            report.flush()
 
+    def close(self):
+        for report in self.reports:
+            report.close()
 
-def read_all_gz_files(path):
+
+def open_sinks(names, results_db=None):
 
     """
-    Reads all '.gz' files in a given directory and checks subfolders. Checks
-    all tacc stats files for errors and writes them to a file.
+    Returns a ReportFanout writing to the sinks named in names, out of
+    SINKS. The modules a sink needs are only imported when it is selected.
+    The mysql sink is left out, with the reason logged, when MySQLdb is not
+    installed or the database cannot be reached.
+    """
+
+    reports = []
+    for name in sorted(set(names), key=SINKS.index):
+        if name == 'text':
+            reports.append(TextReport())
+        elif name == 'jsonl':
+            reports.append(JsonLinesReport())
+        elif name == 'sqlite':
+            reports.append(ResultsStoreReport(results_db))
+        elif name == 'mysql':
+            try:
+                import MySQLdb
+            except ImportError as e:
+                logging.warning('%s: not writing to the database', e)
+                continue
+            try:
+                reports.append(MySqlReport())
+            except MySQLdb.Error as e:
+                logging.debug('%s Could not connect to database', e)
+    return ReportFanout(reports)
+
+
+def read_gz_file(afile, maintain_state=None, backend=None):
+
+    """
+    Reads a single '.gz' file with backend, the reference PythonBackend by
+    default, continuing from the values maintain_state carried over from the
+    previous file of the same host, and checks it for errors. Returns the
+    parser holding the file's data and its error dictionary, or None if the
+    file is empty. Raises IOError or OSError if the file cannot be opened.
+    """
+
+    maintain_state = maintain_state or MAINTAIN_STATE
+    backend = backend or BACKENDS['python']
+    with gzip.open(afile) as filepath:
+        if os.stat(afile).st_size > 31:
+            stp = backend.read_file(afile, filepath, maintain_state)
+            if maintain_state.last_iowait_vals is not None:  # used to ensure the script is not in the first instance of stp
+                append_last_vals(maintain_state.last_iowait_vals, stp.get_dict_of_iowait_lists)
+            checker = stp.check_lists_for_discrepencies(stp.get_dict_of_iowait_lists, afile)
+            maintain_state.set_last_iowait_vals(extract_last_list_val(stp.get_dict_of_iowait_lists))
+            maintain_state.set_last_cpu_total_vals(stp.last_cpu_total_vals)  # sets the list in the MaintainState class in order to maintain cpu total timings across files
+            return stp, checker
+        else:
+            print "File Empty!"
+            return None
+
+
+def process_gz_file(afile, report, maintain_state=None, backend=None):
+
+    """
+    Reads a single '.gz' file with read_gz_file and writes its errors and
+    reboots to report. Returns the file's error dictionary and list of
+    RebootInterval, or None if the file is empty.
+    """
+
+    result = read_gz_file(afile, maintain_state, backend)
+    if result is None:
+        return None
+    stp, checker = result
+    report.write_errors(checker, stp.hostname)
+    report.write_reboots(stp.reboot_intervals)
+    return checker, stp.reboot_intervals
+
+
+def find_time_gaps(file_timestamps, threshold=DEFAULT_GAP_THRESHOLD):
+
+    """
+    Gap analysis over the samples of any number of hosts at once.
+    file_timestamps is a list of (hostname, filename, timestamps), in the
+    order each host's files were read, like MaintainState.file_timestamps.
+    The timestamps of all files are concatenated, grouped by host, and
+    differenced in one pass, so gaps inside files and between them are
+    found alike. Returns the list of GapInterval for every interval longer
+    than threshold seconds between consecutive samples of a host, the
+    filename being the file of the sample ending the gap, and a dict of
+    hostname to the percentage of the host's sampled time span that is not
+    in a gap.
+    """
+
+    file_timestamps = [entry for entry in file_timestamps if len(entry[2])]
+    if not file_timestamps:
+        return [], {}
+
+    hostnames = sorted(set(entry[0] for entry in file_timestamps))
+    host_numbers = dict((hostname, number)
+                        for number, hostname in enumerate(hostnames))
+    lengths = [len(entry[2]) for entry in file_timestamps]
+    timestamps = numpy.concatenate([entry[2] for entry in file_timestamps])
+    sample_hosts = numpy.repeat([host_numbers[entry[0]]
+                                 for entry in file_timestamps], lengths)
+    sample_files = numpy.repeat(numpy.arange(len(file_timestamps)), lengths)
+    order = numpy.argsort(sample_hosts, kind='mergesort')
+    timestamps = timestamps[order]
+    sample_hosts = sample_hosts[order]
+    sample_files = sample_files[order]
+
+    durations = numpy.diff(timestamps)
+    same_host = sample_hosts[1:] == sample_hosts[:-1]
+    gap_positions = numpy.flatnonzero(same_host & (durations > threshold))
+    gaps = [GapInterval(hostnames[host], start, end,
+                        file_timestamps[afile][1])
+            for host, start, end, afile in zip(
+                sample_hosts[gap_positions].tolist(),
+                timestamps[gap_positions].tolist(),
+                timestamps[gap_positions + 1].tolist(),
+                sample_files[gap_positions + 1].tolist())]
+
+    host_starts = numpy.flatnonzero(numpy.concatenate(([True], ~same_host)))
+    spans = numpy.maximum.reduceat(timestamps, host_starts) - \
+        numpy.minimum.reduceat(timestamps, host_starts)
+    gap_time = numpy.bincount(sample_hosts[gap_positions],
+                              weights=durations[gap_positions],
+                              minlength=len(hostnames))
+    coverage = numpy.where(spans > 0,
+                           100 * (1 - gap_time / numpy.maximum(spans, 1)),
+                           100.0)
+    return gaps, dict(zip(hostnames, coverage.tolist()))
+
+
+class StackSampler(object):
+
+    """
+    Sampling profiler. While running, a SIGPROF timer fires every interval
+    seconds of cpu time and the Python stack of the interrupted frame is
+    counted, keyed by its frames joined with ';' from the outermost in. This
+    is the folded stack format read by flamegraph.pl, speedscope and
+    similar tools.
+    """
+
+    def __init__(self, interval=0.005):
+
+        self.interval = interval
+        self.stacks = collections.Counter()
+        self.previous_handler = None
+
+    def sample(self, signum, frame):
+        names = []
+        while frame is not None:
+            code = frame.f_code
+            names.append('%s:%s' % (os.path.basename(code.co_filename),
+                                    code.co_name))
+            frame = frame.f_back
+        self.stacks[';'.join(reversed(names))] += 1
+
+    def start(self):
+        self.stacks = collections.Counter()
+        self.previous_handler = signal.signal(signal.SIGPROF, self.sample)
+        signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+
+    def stop(self):
+        signal.setitimer(signal.ITIMER_PROF, 0, 0)
+        signal.signal(signal.SIGPROF, self.previous_handler)
+
+    def hot_functions(self, count=3):
+
+        """
+        Returns the count functions most often found running, as a list of
+        (function, samples)
+        """
+
+        leaves = collections.Counter()
+        for stack, samples in self.stacks.iteritems():
+            leaves[stack.rsplit(';', 1)[-1]] += samples
+        return leaves.most_common(count)
+
+    def write_folded(self, filename):
+        with open(filename, 'w') as afile:
+            for stack, samples in sorted(self.stacks.iteritems()):
+                afile.write('%s %d\n' % (stack, samples))
+
+
+class FileProfiler(object):
+
+    """
+    Profiles read_all_gz_files one file at a time. Each file is processed
+    under a StackSampler and its folded stacks are written to
+    output_dir/<file>.folded, with the stacks of the whole run in
+    output_dir/all.folded. Wall time, size and line count of every file go
+    to output_dir/profile_summary.tsv, where files that are disproportionately
+    slow per line, have a huge line count or hit a schema mismatch are
+    flagged. The profiler stands in for the backend while a file is read so
+    it can look at the parser afterwards.
+    """
+
+    OUTLIER_FACTOR = 3.0
+
+    def __init__(self, output_dir, interval=0.005):
+
+        self.output_dir = output_dir
+        if not os.path.isdir(output_dir):
+            os.makedirs(output_dir)
+        self.sampler = StackSampler(interval)
+        self.all_stacks = collections.Counter()
+        self.file_stats = []
+        self.backend = None
+        self.parser = None
+
+    def read_file(self, afile, filepath, maintain_state):
+        self.parser = self.backend.read_file(afile, filepath, maintain_state)
+        return self.parser
+
+    def profile(self, afile, report, backend=None):
+
+        """
+        Runs process_gz_file for afile under the sampler and records its
+        statistics
+        """
+
+        self.backend = backend or BACKENDS['python']
+        self.parser = None
+        self.sampler.start()
+        start_time = time.time()
+        try:
+            process_gz_file(afile, report, backend=self)
+        finally:
+            wall_time = time.time() - start_time
+            self.sampler.stop()
+
+        self.sampler.write_folded(os.path.join(
+            self.output_dir, os.path.basename(afile) + '.folded'))
+        self.all_stacks.update(self.sampler.stacks)
+        parser = self.parser
+        self.file_stats.append({
+            'file': afile,
+            'bytes': os.stat(afile).st_size,
+            'lines': parser.fileline if parser else 0,
+            'wall_time': wall_time,
+            'samples': sum(self.sampler.stacks.itervalues()),
+            'hot_functions': self.sampler.hot_functions(),
+            'mismatch_schemas': sorted(parser.mismatch_schemas)
+                                if parser else []})
+
+    def outliers(self, stats):
+
+        """
+        Returns the reasons stats, the statistics of one file, stands out
+        from the median file of the run
+        """
+
+        reasons = []
+        if stats['mismatch_schemas']:
+            reasons.append('schema mismatch: %s' %
+                           ','.join(stats['mismatch_schemas']))
+        per_line = [item['wall_time'] / item['lines']
+                    for item in self.file_stats if item['lines']]
+        lines = [item['lines'] for item in self.file_stats]
+        if stats['lines'] and per_line:
+            median_per_line = numpy.median(per_line)
+            if stats['wall_time'] / stats['lines'] > \
+               self.OUTLIER_FACTOR * median_per_line:
+                reasons.append('slow per line')
+        if lines and stats['lines'] > self.OUTLIER_FACTOR * numpy.median(lines):
+            reasons.append('huge line count')
+        return reasons
+
+    def write_summary(self):
+
+        """
+        Writes the statistics of every file and the folded stacks of the
+        whole run. Returns the list of (file, reasons) for flagged files.
+        """
+
+        flagged = []
+        summary_filename = os.path.join(self.output_dir, 'profile_summary.tsv')
+        with open(summary_filename, 'w') as afile:
+            afile.write('file\tbytes\tlines\twall_time\tlines_per_second\t'
+                        'samples\thot_functions\tflags\n')
+            for stats in self.file_stats:
+                reasons = self.outliers(stats)
+                if reasons:
+                    flagged.append((stats['file'], reasons))
+                lines_per_second = stats['lines'] / stats['wall_time'] \
+                    if stats['wall_time'] else 0
+                afile.write('%s\t%d\t%d\t%.4f\t%.0f\t%d\t%s\t%s\n' % (
+                    stats['file'], stats['bytes'], stats['lines'],
+                    stats['wall_time'], lines_per_second, stats['samples'],
+                    ','.join('%s=%d' % item
+                             for item in stats['hot_functions']),
+                    '; '.join(reasons)))
+        with open(os.path.join(self.output_dir, 'all.folded'), 'w') as afile:
+            for stack, samples in sorted(self.all_stacks.iteritems()):
+                afile.write('%s %d\n' % (stack, samples))
+        return flagged
+
+
+def read_all_gz_files(path, backend=None, profiler=None, afiles=None,
+                      report=None):
+
+    """
+    Reads all '.gz' files in a given directory, or only afiles when given,
+    and checks subfolders. Checks all tacc stats files for errors, using
+    backend, and writes them to report, a new TextReport by default, which
+    is closed at the end. When a FileProfiler is given every file is
+    profiled with it. The time gaps of the files read are then written to
+    the report, and a time coverage line is printed per host.
     """
 
     filecount = 0
-    txt_filename = generate_timestamped_txt('dict_text')
+    report = report or TextReport()
     list_of_gz_files = []
     start_time = time.time()
-    previous_instance = None
-    iowait_extracter = None
     # Collects all files in a directory into a list to sort
 
-    list_of_gz_files = get_list_of_files_in_directory(path)
+    if afiles is None:
+        list_of_gz_files = get_list_of_files_in_directory(path)
+    else:
+        list_of_gz_files = afiles
 
     if len(list_of_gz_files) != 0:
         for afile in sorted(list_of_gz_files):
-            with gzip.open(afile) as filepath:
-                if os.stat(afile).st_size > 31:
-                    filecount += 1
-                    stp = SimpleTaccParser()
-                    stp.read_stats_file(filepath)
-                    if previous_instance is not None:  # used to ensure the script is not in the first instance of stp
-                        append_last_vals(previous_instance, stp.get_dict_of_iowait_lists)
-                    checker = stp.check_lists_for_discrepencies(stp.get_dict_of_iowait_lists, afile)
-                    write_dict_to_txt(checker, txt_filename)
-                    iowait_extracter = extract_last_list_val(stp.get_dict_of_iowait_lists)
-                    previous_instance = iowait_extracter
-                    MAINTAIN_STATE.set_not_first_file(True)  # boolean set to signify the first file is done
-                    MAINTAIN_STATE.set_last_cpu_total_vals(stp.last_cpu_total_vals)  # sets the list in the MaintainState class in order to maintain cpu total timings across files
-                else:
-                    print "File Empty!"
-                    filecount += 1
+            filecount += 1
+            if profiler is None:
+                process_gz_file(afile, report, backend=backend)
+            else:
+                profiler.profile(afile, report, backend)
 
         print 'Read all %s files in directory in %d seconds' % (
             filecount, time.time() - start_time)
+        gaps, coverage = find_time_gaps(MAINTAIN_STATE.file_timestamps,
+                                        MAINTAIN_STATE.gap_threshold)
+        MAINTAIN_STATE.all_gap_intervals.extend(gaps)
+        report.write_gaps(gaps)
+        for hostname, percent in sorted(coverage.iteritems()):
+            print '%s: %d time gaps, %.2f%% of the time sampled' % (
+                hostname, sum(1 for gap in gaps if gap.host == hostname),
+                percent)
+        if profiler is not None:
+            for afile, reasons in profiler.write_summary():
+                print 'Outlier %s: %s' % (afile, ', '.join(reasons))
+            print 'Profile written to %s' % (profiler.output_dir)
     else:  # If there are no gz files in directory or its children
         print 'No \'.gz\' files in %s' % (path)
-    
+    report.close()
+
+
+class WatchedHost(object):
+
+    """
+    Polling state for one host directory in watch mode. Keeps the host's
+    MaintainState warm between polls so each new file continues from the
+    last one read, and remembers the size and mtime of every file seen so a
+    file is only parsed once it has stopped changing. sampled_time holds,
+    per hostname, the seconds spanned by the samples read so far, the
+    seconds of them in time gaps and the number of gaps.
+    """
+
+    def __init__(self, directory, gap_threshold=DEFAULT_GAP_THRESHOLD):
+
+        self.directory = directory
+        self.maintain_state = MaintainState()
+        self.maintain_state.set_gap_threshold(gap_threshold)
+        self.directory_mtime = None
+        self.pending = {}
+        self.processed = set()
+        self.sampled_time = {}
+
+    def poll(self, settle_time):
+
+        """
+        Returns, oldest first, the new '.gz' files that are ready to be
+        parsed. A file is ready once its size and mtime are unchanged since
+        the previous poll, or it was last modified more than settle_time
+        seconds ago. The directory is only listed again when its own mtime
+        changes or files are still pending.
+        """
+
+        directory_mtime = os.stat(self.directory).st_mtime
+        if directory_mtime == self.directory_mtime and not self.pending:
+            return []
+        self.directory_mtime = directory_mtime
+
+        now = time.time()
+        ready = []
+        for afile in get_list_of_files_in_directory(self.directory):
+            if afile in self.processed:
+                continue
+            try:
+                stat = os.stat(afile)
+            except OSError:  # rotated away between listing and stat
+                self.pending.pop(afile, None)
+                continue
+            signature = (stat.st_size, stat.st_mtime)
+            if self.pending.get(afile) == signature or \
+               now - stat.st_mtime > settle_time:
+                ready.append(afile)
+            else:
+                self.pending[afile] = signature
+        for afile in ready:
+            self.pending.pop(afile, None)
+        return sorted(ready)
+
+
+class ArchiveWatcher(object):
+
+    """
+    Long running service mode. Watches an archive tree, either a single
+    hostname directory or a directory of hostname directories, and parses
+    new '.gz' files as they arrive instead of rescanning every host on a
+    schedule. Errors found in each file are written to report straight
+    away, and so are the time gaps found in or before the files of each
+    poll. report is flushed after every poll and closed when the watcher
+    stops.
+    """
+
+    def __init__(self, root, report, interval=60, backend=None,
+                 gap_threshold=DEFAULT_GAP_THRESHOLD):
+
+        self.root = root
+        self.report = report
+        self.interval = interval
+        self.backend = backend
+        self.gap_threshold = gap_threshold
+        self.hosts = {}
+
+    def poll(self):
+
+        """
+        Runs a single pass over every host directory, parsing the files that
+        are ready. A file that cannot be opened, because it was rotated away
+        between polls, is logged and marked as processed so it is not
+        retried on every poll; corrupt files are handled by the engines.
+        Errors writing to the report are raised. Returns the number of files
+        parsed.
+        """
+
+        filecount = 0
+        for directory in get_host_directories(self.root):
+            host = self.hosts.get(directory)
+            if host is None:
+                host = self.hosts[directory] = WatchedHost(directory,
+                                                           self.gap_threshold)
+            ready = host.poll(self.interval)
+            for afile in ready:
+                logging.info('Processing new file %s', afile)
+                try:
+                    result = read_gz_file(afile, host.maintain_state,
+                                          self.backend)
+                except (IOError, OSError, EOFError, zlib.error) as e:
+                    logging.error('Skipping %s, could not read it: %s',
+                                  afile, e)
+                    host.processed.add(afile)
+                    continue
+                host.processed.add(afile)
+                if result is not None:
+                    stp, checker = result
+                    self.report.write_errors(checker, stp.hostname)
+                    self.report.write_reboots(stp.reboot_intervals)
+                filecount += 1
+                host.maintain_state.all_error_dict.clear()
+                del host.maintain_state.all_reboot_intervals[:]
+            if ready:
+                self.poll_gaps(host)
+        self.report.flush()
+        return filecount
+
+    def poll_gaps(self, host):
+
+        """
+        Finds the time gaps in the files of the WatchedHost host read since
+        its last poll, and before the first of them, and prints the
+        percentage of the time sampled since the host was first read. Only
+        the host's last sample is kept for the next poll.
+        """
+
+        maintain_state = host.maintain_state
+        gaps, coverage = find_time_gaps(maintain_state.file_timestamps,
+                                        self.gap_threshold)
+        self.report.write_gaps(gaps)
+        sampled = [entry for entry in maintain_state.file_timestamps
+                   if len(entry[2])]
+        for hostname, percent in sorted(coverage.iteritems()):
+            timestamps = numpy.concatenate([entry[2] for entry in sampled
+                                            if entry[0] == hostname])
+            span = timestamps.max() - timestamps.min()
+            totals = host.sampled_time.setdefault(hostname, [0.0, 0.0, 0])
+            totals[0] += span
+            totals[1] += span * (100 - percent) / 100
+            totals[2] += sum(1 for gap in gaps if gap.host == hostname)
+            print '%s: %d time gaps, %.2f%% of the time sampled' % (
+                hostname, totals[2],
+                100 * (1 - totals[1] / totals[0]) if totals[0] else 100.0)
+        maintain_state.file_timestamps[:] = [
+            (hostname, afile, timestamps[-1:])
+            for hostname, afile, timestamps in sampled[-1:]]
+
+    def run(self):
+
+        """
+        Polls the archive tree every self.interval seconds until interrupted
+        """
+
+        print 'Watching %s for new \'.gz\' files every %d seconds' % (
+            self.root, self.interval)
+        try:
+            while True:
+                start_time = time.time()
+                filecount = self.poll()
+                if filecount:
+                    print 'Read %s new files in %d seconds' % (
+                        filecount, time.time() - start_time)
+                time.sleep(max(0, self.interval - (time.time() - start_time)))
+        except KeyboardInterrupt:
+            print 'Stopped watching %s' % (self.root)
+        self.report.close()
+
+
 def get_list_of_files_in_directory(fulldir):
     match = []
     gz_dir = os.listdir(fulldir)
@@ -911,34 +2346,428 @@ def get_list_of_files_in_directory(fulldir):
             match.append(path)
     return match
 
+
+def get_host_directories(root):
+
+    """
+    Returns the hostname directories under root, which is itself treated as
+    one when it directly holds '.gz' files
+    """
+
+    if get_list_of_files_in_directory(root):
+        return [root]
+    return [os.path.join(root, name)
+            for name in sorted(os.listdir(root))
+            if os.path.isdir(os.path.join(root, name))]
+
+
+DISCREPANCY_RECORD = numpy.dtype([('host', 'S64'), ('device', 'S16'),
+                                  ('timestamp', 'f8'),
+                                  ('discrepency', 'i8'),
+                                  ('filename', 'S512')])
+REBOOT_RECORD = numpy.dtype([('host', 'S64'), ('start', 'f8'), ('end', 'f8'),
+                             ('filename', 'S512')])
+GAP_RECORD = REBOOT_RECORD
+HOST_SUMMARY_RECORD = numpy.dtype([('host', 'S64'), ('files', 'i8'),
+                                   ('discrepancies', 'i8'),
+                                   ('reboots', 'i8'), ('gaps', 'i8'),
+                                   ('coverage', 'f8')])
+RECORD_TYPES = {
+    'discrepancies': DISCREPANCY_RECORD,
+    'reboots': REBOOT_RECORD,
+    'gaps': GAP_RECORD,
+    'hosts': HOST_SUMMARY_RECORD
+}
+
+
+def _nan_if_none(value):
+    return numpy.nan if value is None else value
+
+
+def _none_if_nan(value):
+    return None if numpy.isnan(value) else float(value)
+
+
+class WorkerRecordWriter(object):
+
+    """
+    Report sink for parallel workers. Instead of text, the discrepancies,
+    reboot and gap intervals and per-host summary of one host are appended
+    as fixed-layout records to files private to the worker process, which
+    the coordinator memory maps with merge_worker_records. Nothing but the
+    host directory name travels back through the process pool. Records are
+    keyed by the $hostname of the file headers, like in serial runs, and
+    by host, the directory name, for files without one.
+    """
+
+    def __init__(self, directory, host):
+
+        self.host = host
+        self.hostname = None
+        self.paths = dict(
+            (kind, os.path.join(directory, 'worker-%d.%s' % (os.getpid(),
+                                                             kind)))
+            for kind in RECORD_TYPES)
+        self.files = 0
+        self.discrepancies = 0
+        self.reboots = 0
+        self.gaps = 0
+
+    def _append(self, kind, rows):
+
+        """
+        Appends rows as records of kind. Raises ValueError if a string does
+        not fit its field, since numpy would silently cut it short and the
+        merged records would no longer match the files they came from.
+        """
+
+        dtype = RECORD_TYPES[kind]
+        for column, name in enumerate(dtype.names):
+            field_type = dtype.fields[name][0]
+            if field_type.kind != 'S':
+                continue
+            for row in rows:
+                if len(row[column]) > field_type.itemsize:
+                    raise ValueError('%s %r is longer than the %d bytes of '
+                                     'the %s records' % (
+                                         name, row[column],
+                                         field_type.itemsize, kind))
+        with open(self.paths[kind], 'ab') as afile:
+            numpy.array(rows, dtype=dtype).tofile(afile)
+
+    def record_host(self, hostname):
+
+        """
+        Returns the host to key the records of a file with header hostname
+        by, which is remembered for the host summary
+        """
+
+        if hostname:
+            self.hostname = self.hostname or hostname
+            return hostname
+        return self.host
+
+    def write_errors(self, any_dict, hostname=None):
+
+        """
+        Appends the tuples of an error dictionary as DISCREPANCY_RECORD
+        """
+
+        self.files += 1
+        host = self.record_host(hostname)
+        rows = [(host, device_name, _nan_if_none(timestamp),
+                 int(discrepency_string.rsplit(' ', 1)[-1]), filename)
+                for filename, onelist in any_dict.iteritems()
+                for device_name, timestamp, discrepency_string in onelist]
+        if rows:
+            self._append('discrepancies', rows)
+            self.discrepancies += len(rows)
+
+    def write_reboots(self, intervals):
+
+        """
+        Appends a list of RebootInterval as REBOOT_RECORD
+        """
+
+        rows = [(self.record_host(interval.host),
+                 _nan_if_none(interval.start), _nan_if_none(interval.end),
+                 interval.filename)
+                for interval in intervals]
+        if rows:
+            self._append('reboots', rows)
+            self.reboots += len(rows)
+
+    def write_gaps(self, intervals):
+
+        """
+        Appends a list of GapInterval as GAP_RECORD
+        """
+
+        rows = [(self.record_host(interval.host), interval.start,
+                 interval.end, interval.filename) for interval in intervals]
+        if rows:
+            self._append('gaps', rows)
+            self.gaps += len(rows)
+
+    def write_host_summary(self, coverage):
+
+        """
+        Appends the counters and the time coverage percentage of the host
+        as a HOST_SUMMARY_RECORD
+        """
+
+        self._append('hosts', [(self.hostname or self.host, self.files,
+                                self.discrepancies, self.reboots, self.gaps,
+                                coverage)])
+
+
+def merge_worker_records(directory):
+
+    """
+    Memory maps the record files every worker wrote to directory and returns
+    a dict of record kind to a single array holding the records of all
+    workers
+    """
+
+    merged = {}
+    for kind, dtype in RECORD_TYPES.iteritems():
+        arrays = []
+        for filename in sorted(os.listdir(directory)):
+            path = os.path.join(directory, filename)
+            if filename.endswith('.' + kind) and os.path.getsize(path):
+                arrays.append(numpy.memmap(path, dtype=dtype, mode='r'))
+        merged[kind] = numpy.concatenate(arrays) if arrays \
+            else numpy.zeros(0, dtype=dtype)
+    return merged
+
+
+def _read_host_directory(task):
+
+    """
+    Process pool task reading every '.gz' file of one host directory, in
+    order, with a fresh MaintainState, then finding its time gaps
+    """
+
+    directory, records_directory, backend_name, gap_threshold = task
+    writer = WorkerRecordWriter(records_directory,
+                                os.path.basename(os.path.normpath(directory)))
+    maintain_state = MaintainState()
+    maintain_state.set_gap_threshold(gap_threshold)
+    for afile in sorted(get_list_of_files_in_directory(directory)):
+        process_gz_file(afile, writer, maintain_state, BACKENDS[backend_name])
+    gaps, coverage = find_time_gaps(
+        [(writer.record_host(hostname), afile, timestamps)
+         for hostname, afile, timestamps in maintain_state.file_timestamps],
+        gap_threshold)
+    writer.write_gaps(gaps)
+    writer.write_host_summary(coverage.get(writer.hostname or writer.host,
+                                           100.0))
+    return directory
+
+
+def read_host_directories_in_parallel(root, workers, backend=None,
+                                      gap_threshold=DEFAULT_GAP_THRESHOLD,
+                                      report=None):
+
+    """
+    Reads every hostname directory under root in a pool of workers
+    processes. The merged records are added to MAINTAIN_STATE, written to
+    report, a new TextReport by default, which is then closed, and a
+    per-host summary is printed. Returns the merged records.
+    """
+
+    import multiprocessing
+
+    backend = backend or BACKENDS['python']
+    start_time = time.time()
+    directories = get_host_directories(root)
+    records_directory = tempfile.mkdtemp(prefix='iowait_workers_')
+    try:
+        pool = multiprocessing.Pool(workers)
+        try:
+            tasks = [(directory, records_directory, backend.name,
+                      gap_threshold) for directory in directories]
+            for directory in pool.imap_unordered(_read_host_directory,
+                                                 tasks):
+                logging.info('Finished host directory %s', directory)
+            pool.close()
+        finally:
+            pool.terminate()
+            pool.join()
+        records = merge_worker_records(records_directory)
+    finally:
+        shutil.rmtree(records_directory)
+
+    error_dict = {}
+    file_hosts = {}
+    for record in records['discrepancies']:
+        error_dict.setdefault(record['filename'], []).append((
+            record['device'], _none_if_nan(record['timestamp']),
+            'iowait difference: %d' % record['discrepency']))
+        file_hosts[record['filename']] = record['host']
+    intervals = [RebootInterval(record['host'], _none_if_nan(record['start']),
+                                _none_if_nan(record['end']),
+                                record['filename'])
+                 for record in records['reboots']]
+    gaps = [GapInterval(record['host'], float(record['start']),
+                        float(record['end']), record['filename'])
+            for record in records['gaps']]
+    MAINTAIN_STATE.all_error_dict.update(error_dict)
+    MAINTAIN_STATE.all_reboot_intervals.extend(intervals)
+    MAINTAIN_STATE.all_gap_intervals.extend(gaps)
+
+    report = report or TextReport()
+    for filename in sorted(error_dict):
+        report.write_errors({filename: error_dict[filename]},
+                            file_hosts[filename])
+    report.write_reboots(intervals)
+    report.write_gaps(gaps)
+    report.close()
+
+    hosts = numpy.sort(records['hosts'], order='host')
+    for host in hosts:
+        print '%s: %d files, %d discrepancies, %d reboots, %d time gaps, ' \
+            '%.2f%% of the time sampled' % (
+                host['host'], host['files'], host['discrepancies'],
+                host['reboots'], host['gaps'], host['coverage'])
+    print 'Read %d host directories with %d workers in %d seconds' % (
+        len(directories), workers, time.time() - start_time)
+    return records
+
+
+def parse_arguments(argv):
+
+    """
+    Builds the command line interface for main and parses argv
+    """
+
+    parser = argparse.ArgumentParser(description='Check tacc stats log files '
+                                     'for iowait discrepancies')
+    parser.add_argument('directory', nargs='?',
+                        help='hostname directory containing tacc log files')
+    parser.add_argument('--results-db',
+                        help='local SQLite results store the sqlite sink '
+                             'writes to (default: iowait_results.db)')
+    outputs = parser.add_mutually_exclusive_group()
+    outputs.add_argument('--sink', action='append', choices=SINKS,
+                         help='where to write the results, may be repeated '
+                              '(default: %s, or %s with --watch)' % (
+                                  ' '.join(DEFAULT_SINKS),
+                                  ' '.join(WATCH_SINKS)))
+    outputs.add_argument('--dry-run', action='store_true',
+                         help='only parse and print what was found, '
+                              'writing nothing')
+    parser.add_argument('--watch', action='store_true',
+                        help='keep running and parse new files as they '
+                             'arrive; directory may also hold hostname '
+                             'directories')
+    parser.add_argument('--interval', type=int, default=60,
+                        help='seconds between polls in watch mode '
+                             '(default: %(default)s)')
+    parser.add_argument('--backend', choices=sorted(BACKENDS),
+                        help='parsing engine, python is the line by line '
+                             'reference and numpy the vectorized engine '
+                             '(default: %s)' % PythonBackend.name)
+    parser.add_argument('--profile', metavar='OUTPUT_DIR',
+                        help='profile every file, writing folded stacks for '
+                             'flamegraph tools and a per-file summary that '
+                             'flags outliers to OUTPUT_DIR')
+    parser.add_argument('--profile-interval', type=float, default=0.005,
+                        help='seconds of cpu time between profile samples '
+                             '(default: %(default)s)')
+    parser.add_argument('--gap-threshold', type=float,
+                        default=DEFAULT_GAP_THRESHOLD, metavar='SECONDS',
+                        help='report intervals between samples longer than '
+                             'this as time gaps (default: %(default)s)')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='read the hostname directories under directory '
+                             'in this many processes (default: %(default)s)')
+    parser.add_argument('--index', metavar='INDEX_FILE',
+                        help='archive index to refresh and select files '
+                             'from, see archive_index.py')
+    parser.add_argument('--start', type=float,
+                        help='with --index, only read files with samples '
+                             'at or after this time (epoch)')
+    parser.add_argument('--end', type=float,
+                        help='with --index, only read files with samples '
+                             'before this time (epoch)')
+    parser.add_argument('--check-conformance', action='store_true',
+                        help='read directory with every backend, report '
+                             'whether they agree and exit')
+    args = parser.parse_args(argv)
+
+    # options the selected mode would otherwise silently ignore
+    if args.check_conformance:
+        mode, ignored = '--check-conformance', (
+            ('--sink', args.sink), ('--dry-run', args.dry_run),
+            ('--workers', args.workers > 1), ('--backend', args.backend),
+            ('--watch', args.watch), ('--index', args.index),
+            ('--profile', args.profile))
+    elif args.watch:
+        mode, ignored = '--watch', (
+            ('--index', args.index), ('--start', args.start is not None),
+            ('--end', args.end is not None), ('--profile', args.profile),
+            ('--workers', args.workers > 1))
+    elif args.workers > 1:
+        mode, ignored = '--workers', (('--index', args.index),
+                                      ('--profile', args.profile))
+    else:
+        mode, ignored = None, ()
+    for option, given in ignored:
+        if given:
+            parser.error('%s cannot be used with %s' % (option, mode))
+    if (args.start is not None or args.end is not None) and not args.index:
+        parser.error('--start and --end select files from an archive index '
+                     'and need --index')
+    args.backend = args.backend or PythonBackend.name
+    return args
+
+
 def main():
 
     """
     Main method takes in a directory and checks each
-    sub-directory's files for errors. Handles if file path is invalid. Sql
-    entries are inserted here after reading all the files in the filepath.
+    sub-directory's files for errors. Handles if file path is invalid. The
+    errors, reboots and time gaps are written to the sinks selected with
+    --sink, and only the modules those sinks need are loaded.
     """
 
     logging.basicConfig(format='%(asctime)s [%(levelname)s] %(message)s',
                         datefmt='%Y-%m-%dT%H:%M:%S',
                         level=logging.DEBUG)
-    
-    file_names = sys.argv[1:]
-    if len(file_names) == 0:
+
+    args = parse_arguments(sys.argv[1:])
+    if args.directory is None:
         print 'Please input a directory that holds \'.gz\' files'
+    elif args.check_conformance:
+        if check_backend_conformance(args.directory):
+            print 'All backends agree on %s' % (args.directory)
+        else:
+            print 'Backends disagree on %s' % (args.directory)
+            sys.exit(1)
+    elif args.watch:
+        report = open_sinks([] if args.dry_run else args.sink or WATCH_SINKS,
+                            args.results_db)
+        ArchiveWatcher(args.directory, report, args.interval,
+                       BACKENDS[args.backend], args.gap_threshold).run()
     else:
         try:
-            print 'Reading files from directory: %s' % (sys.argv[1])
-            read_all_gz_files(sys.argv[1])
-            try:
-                sql_instance = SqlInsert('localhost', 'xdtas', '###PASS###', 'ts_analysis')
-                sql_instance.recursive_insert(MAINTAIN_STATE.all_error_dict)
-            except mdb.Error as e:
-                logging.debug('%s Could not connect to database', e)
+            print 'Reading files from directory: %s' % (args.directory)
+            report = open_sinks(
+                [] if args.dry_run else args.sink or DEFAULT_SINKS,
+                args.results_db)
+            if args.workers > 1:
+                read_host_directories_in_parallel(args.directory, args.workers,
+                                                  BACKENDS[args.backend],
+                                                  args.gap_threshold, report)
+            else:
+                MAINTAIN_STATE.set_gap_threshold(args.gap_threshold)
+                profiler = None
+                if args.profile:
+                    profiler = FileProfiler(args.profile, args.profile_interval)
+                afiles = None
+                if args.index:
+                    from archive_index import ArchiveIndex
+                    archive_index = ArchiveIndex(args.index)
+                    archive_index.refresh(args.directory)
+                    afiles = [afile for afile in archive_index.files_in_window(
+                        args.start, args.end)
+                              if os.path.dirname(afile) ==
+                              os.path.abspath(args.directory)]
+                    archive_index.close()
+                read_all_gz_files(args.directory, BACKENDS[args.backend],
+                                  profiler, afiles, report)
+            if args.dry_run:
+                print 'Dry run, nothing written: %d discrepancies, %d ' \
+                    'reboots, %d time gaps found' % (
+                        sum(len(errors) for errors in
+                            MAINTAIN_STATE.all_error_dict.itervalues()),
+                        len(MAINTAIN_STATE.all_reboot_intervals),
+                        len(MAINTAIN_STATE.all_gap_intervals))
         except OSError as osexcept:
             print '%s: Oops %s doesn\'t appear to be a valid file path!' % (
-                osexcept, sys.argv[1])
-    
+                osexcept, args.directory)
+
 
 if __name__ == "__main__":
     main()
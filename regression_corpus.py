@@ -0,0 +1,599 @@
+""" Generated tacc stats archives with known results, and a harness that checks the parser against them """
+import argparse
+import collections
+import gzip
+import json
+import logging
+import os
+import random
+import shutil
+import StringIO
+import sys
+import tempfile
+import time
+
+from archive_index import ArchiveIndex
+from example_parser import (BACKENDS, MaintainState, TextReport,
+                            find_time_gaps, get_host_directories,
+                            get_list_of_files_in_directory, process_gz_file)
+
+MANIFEST_NAME = 'manifest.json'
+DEFAULT_RESULTS = 'regression_results.tsv'
+
+INTERVAL = 600  # seconds between samples, as on Stampede
+MAX_SCALE = 50  # counters of larger corpora would wrap where not planted
+GAP_THRESHOLD = 1200  # longer intervals are recorded as gaps
+COUNTER_MODULUS = 2 ** 32  # counters are written as 32 bit values
+
+CPU_KEYS = ('user', 'nice', 'system', 'idle', 'iowait', 'irq', 'softirq')
+CPU_SCHEMAS = {
+    # the tacc_stats 1.0 layout, and a later one with extra counters around
+    # it so iowait is found at another column
+    'v1': CPU_KEYS,
+    'v2': ('steal',) + CPU_KEYS + ('guest',)
+}
+TACC_VERSIONS = {'v1': '1.0.2', 'v2': '2.0.0'}
+
+# (low, high) increment of each cpu counter per sample, in centiseconds
+INCREMENTS = {
+    'user': (1000, 20000),
+    'nice': (0, 50),
+    'system': (100, 3000),
+    'idle': (20000, 50000),
+    'iowait': (1, 500),
+    'irq': (0, 10),
+    'softirq': (0, 100),
+    'steal': (0, 10),
+    'guest': (0, 10)
+}
+BLOCK_SCHEMA = ('!block rd_ios,E rd_merges,E rd_sectors,E,U=512B '
+                'rd_ticks,E,U=ms wr_ios,E wr_merges,E wr_sectors,E,U=512B '
+                'wr_ticks,E,U=ms in_flight io_ticks,E,U=ms '
+                'time_in_queue,E,U=ms\n')
+
+
+def cpu_schema_line(schema_name):
+    return '!cpu %s\n' % ' '.join('%s,E,U=cs' % key
+                                  for key in CPU_SCHEMAS[schema_name])
+
+
+class HostArchive(object):
+
+    """
+    Writes the archive files of one generated host, one per (schema, samples)
+    entry of files, and keeps the ground truth of what was planted in them.
+    events maps a sample number, counted across all files of the host, to a
+    list of
+        ('drop', core): the iowait value of core is read lower than the
+            sample before
+        ('reboot',): the counters of every core start over
+        ('wrap', core, key): the 32 bit counter key of core wraps around
+        ('gap', seconds): the sample is taken seconds later than usual
+    A schema name of 'mismatch' writes a header describing cpu twice, in the
+    v1 and then the v2 layout, with v1 records. One of 'truncated' writes a
+    v1 file followed by a second gzip member of block records that is cut
+    off halfway, like an archive whose copy was interrupted: it cannot be
+    decompressed to the end, but every sample is still readable.
+    """
+
+    def __init__(self, root, scenario, hostname, cores, files, events, rng,
+                 start):
+
+        self.root = root
+        self.scenario = scenario
+        self.hostname = hostname
+        self.cores = cores
+        self.files = files
+        self.events = events
+        self.rng = rng
+        self.start = start
+        self.drops = []
+        self.reboots = []
+        self.gaps = []
+        self.line_count = 0
+        self.byte_count = 0
+        self.file_count = 0
+        self.coverage = None
+
+    def increment(self, key):
+        return self.rng.randint(*INCREMENTS[key])
+
+    def append_truncated_member(self, path, block_counters):
+
+        """
+        Appends the first half of a gzip member of block records to path
+        """
+
+        member = StringIO.StringIO()
+        with gzip.GzipFile(fileobj=member, mode='wb') as afile:
+            for _ in xrange(500):
+                block_counters = [value + self.rng.randint(0, 1000)
+                                  for value in block_counters]
+                afile.write('block sda %s\n' % ' '.join(
+                    str(value) for value in block_counters))
+        with open(path, 'ab') as afile:
+            afile.write(member.getvalue()[:len(member.getvalue()) // 2])
+
+    def write(self):
+
+        """
+        Writes the files and fills in drops, reboots and gaps
+        """
+
+        directory = os.path.join(self.root, self.scenario, self.hostname)
+        os.makedirs(directory)
+        keys = CPU_SCHEMAS['v2']
+        counters = [dict((key, self.rng.randint(10 ** 6, 10 ** 8))
+                         for key in keys) for _ in xrange(self.cores)]
+        last_iowait = [None] * self.cores
+        block_counters = [self.rng.randint(0, 10 ** 6) for _ in xrange(11)]
+        previous_timestamp = None
+        sample = 0
+
+        for schema_name, samples in self.files:
+            layout = 'v1' if schema_name in ('mismatch', 'truncated') \
+                else schema_name
+            lines = ['$tacc_stats %s\n' % TACC_VERSIONS[layout],
+                     '$hostname %s\n' % self.hostname,
+                     '$uname Linux x86_64 2.6.32-358.el6.x86_64\n',
+                     cpu_schema_line(layout)]
+            if schema_name == 'mismatch':
+                lines.append(cpu_schema_line('v2'))
+            lines.append(BLOCK_SCHEMA)
+            filename = None
+
+            for _ in xrange(samples):
+                events = self.events.get(sample, ())
+                wraps_next = [event for event in
+                              self.events.get(sample + 1, ())
+                              if event[0] == 'wrap']
+                if previous_timestamp is None:
+                    timestamp = self.start
+                else:
+                    timestamp = previous_timestamp + INTERVAL + sum(
+                        event[1] for event in events if event[0] == 'gap')
+                if filename is None:
+                    filename = os.path.join(self.scenario, self.hostname,
+                                            '%d.gz' % timestamp)
+                if previous_timestamp is not None and \
+                   timestamp - previous_timestamp > GAP_THRESHOLD:
+                    self.gaps.append((self.hostname, previous_timestamp,
+                                      timestamp, filename))
+                if ('reboot',) in events:
+                    self.reboots.append((self.hostname, previous_timestamp,
+                                         timestamp, filename))
+                lines.append('%d %d\n' % (timestamp, 2000000 + sample))
+
+                for core in xrange(self.cores):
+                    values = counters[core]
+                    for key in keys:
+                        if ('reboot',) in events:
+                            values[key] = self.rng.randint(0, 10)
+                        else:
+                            values[key] += self.increment(key)
+                        if ('wrap', core, key) in events:
+                            values[key] += 10
+                        elif ('wrap', core, key) in wraps_next:
+                            # just below the wrap, which the next sample
+                            # crosses
+                            values[key] += COUNTER_MODULUS - 1 - \
+                                values[key] % COUNTER_MODULUS - \
+                                self.rng.randint(0, 9)
+                    written = dict((key, values[key] % COUNTER_MODULUS)
+                                   for key in keys)
+                    if ('drop', core) in events:
+                        difference = self.rng.randint(
+                            1, min(500, last_iowait[core]))
+                        written['iowait'] = last_iowait[core] - difference
+                        self.drops.append((filename, 'cpu%d' % core,
+                                           timestamp, difference))
+                    last_iowait[core] = written['iowait']
+                    lines.append('cpu %d %s\n' % (core, ' '.join(
+                        str(written[key]) for key in CPU_SCHEMAS[layout])))
+
+                block_counters = [value + self.rng.randint(0, 1000)
+                                  for value in block_counters]
+                lines.append('block sda %s\n' % ' '.join(
+                    str(value) for value in block_counters))
+                previous_timestamp = timestamp
+                sample += 1
+
+            data = ''.join(lines)
+            with gzip.open(os.path.join(self.root, filename), 'wb') as afile:
+                afile.write(data)
+            if schema_name == 'truncated':
+                self.append_truncated_member(os.path.join(self.root,
+                                                          filename),
+                                             block_counters)
+            self.file_count += 1
+            self.line_count += len(lines)
+            self.byte_count += len(data)
+
+        gap_time = sum(end - start for _, start, end, _ in self.gaps)
+        self.coverage = 100 * (1 - float(gap_time) /
+                               (previous_timestamp - self.start))
+
+
+def pick_samples(rng, candidates, count, taken):
+
+    """
+    Picks up to count samples from candidates that are at least three
+    samples away from every sample in taken, and adds them to taken
+    """
+
+    candidates = list(candidates)
+    rng.shuffle(candidates)
+    picked = []
+    for sample in candidates:
+        if len(picked) == count:
+            break
+        if all(abs(sample - other) >= 3 for other in taken):
+            picked.append(sample)
+            taken.add(sample)
+    return sorted(picked)
+
+
+def plan_events(rng, files, cores, drops=0, boundary_drops=0, reboots=0,
+                boundary_reboots=0, wraps=0, gaps=0, boundary_gaps=0):
+
+    """
+    Returns an events dict for HostArchive with the given number of each
+    event at random samples. Boundary events fall on the first sample of a
+    file other than the first.
+    """
+
+    firsts = []
+    total = 0
+    for _, samples in files:
+        firsts.append(total)
+        total += samples
+    boundaries = firsts[1:]
+    inside = [sample for sample in xrange(2, total - 1)
+              if sample not in firsts]
+    events = collections.defaultdict(list)
+    taken = set()
+
+    for sample in pick_samples(rng, boundaries, boundary_reboots, taken) + \
+            pick_samples(rng, inside, reboots, taken):
+        events[sample].append(('reboot',))
+    for sample in pick_samples(rng, boundaries, boundary_drops, taken) + \
+            pick_samples(rng, inside, drops, taken):
+        events[sample].append(('drop', rng.randrange(cores)))
+    for sample in pick_samples(rng, inside, wraps, taken):
+        events[sample].append(('wrap', rng.randrange(cores),
+                               rng.choice(('iowait', 'user', 'idle'))))
+    # gaps may fall on samples holding other events
+    gap_samples = set()
+    for sample in pick_samples(rng, boundaries, boundary_gaps, gap_samples) + \
+            pick_samples(rng, inside, gaps, gap_samples):
+        events[sample].append(('gap', rng.choice((1800, 3600, 86400))))
+    return dict(events)
+
+
+def scenarios(scale):
+
+    """
+    Returns (name, description, hosts) for every scenario, where hosts is a
+    list of (cores, files, event counts) and files a list of
+    (schema name, samples)
+    """
+
+    day = 144 * scale
+
+    def files(count, schema='v1'):
+        return [(schema, day)] * count
+
+    return [
+        ('baseline', 'no events, for throughput',
+         [(16, files(4), {}), (16, files(4), {})]),
+        ('drops', 'iowait drops inside files and on file boundaries',
+         [(cores, files(3), dict(drops=10, boundary_drops=2))
+          for cores in (8, 16, 32)]),
+        ('reboots', 'reboots inside files and on file boundaries, on hosts '
+         'with fewer and more than 16 cores',
+         [(cores, files(3), dict(reboots=2, boundary_reboots=1, drops=4))
+          for cores in (4, 16, 20)]),
+        ('time_gaps', 'sampling gaps inside and between files, some on '
+         'drops',
+         [(16, files(3), dict(gaps=4, boundary_gaps=1, drops=6,
+                              boundary_drops=1)) for _ in xrange(2)]),
+        ('schema_versions', 'files of one host in different cpu schemas, '
+         'and a header describing cpu twice',
+         [(16, [('v1', day), ('v2', day), ('mismatch', day), ('v1', day)],
+           dict(drops=8, boundary_drops=2)) for _ in xrange(2)]),
+        ('wraps', '32 bit counter wraps, which are neither drops nor '
+         'reboots',
+         [(cores, files(3), dict(wraps=6, drops=4))
+          for cores in (16, 32)]),
+        ('mixed', 'every kind of event on hosts of various sizes',
+         [(cores, files(6), dict(drops=12, boundary_drops=2, reboots=1,
+                                 boundary_reboots=1, wraps=3, gaps=2,
+                                 boundary_gaps=1))
+          for cores in (8, 16, 20, 32)]),
+        ('corrupt', 'archives cut off after their last sample, with drops '
+         'and reboots in and around them',
+         [(16, [('v1', day), ('truncated', day), ('v1', day),
+                ('truncated', day)],
+           dict(drops=6, boundary_drops=2, reboots=1, boundary_reboots=1))
+          for _ in xrange(2)])
+    ]
+
+
+def generate_corpus(root, seed=0, scale=1):
+
+    """
+    Writes every scenario under root, each as a directory of hostname
+    directories, and the ground truth to root/manifest.json. Returns the
+    manifest.
+    """
+
+    if not 1 <= scale <= MAX_SCALE:
+        raise ValueError('scale must be between 1 and %d' % MAX_SCALE)
+    manifest = {'seed': seed, 'scale': scale, 'interval': INTERVAL,
+                'gap_threshold': GAP_THRESHOLD, 'scenarios': {}}
+    host_number = 0
+    for number, (name, description, hosts) in enumerate(scenarios(scale)):
+        rng = random.Random('%d %s' % (seed, name))
+        entry = {'description': description, 'hosts': [], 'files': 0,
+                 'lines': 0, 'bytes': 0, 'drops': [], 'reboots': [],
+                 'gaps': [], 'coverage': {}}
+        for cores, files, event_counts in hosts:
+            host_number += 1
+            hostname = 'c%03d-%03d.stampede.tacc.utexas.edu' % (
+                400 + number, 100 + host_number)
+            archive = HostArchive(root, name, hostname, cores, files,
+                                  plan_events(rng, files, cores,
+                                              **event_counts),
+                                  rng, 1360000000 + 7 * host_number)
+            archive.write()
+            entry['hosts'].append(hostname)
+            entry['files'] += archive.file_count
+            entry['lines'] += archive.line_count
+            entry['bytes'] += archive.byte_count
+            entry['drops'].extend(archive.drops)
+            entry['reboots'].extend(archive.reboots)
+            entry['gaps'].extend(archive.gaps)
+            entry['coverage'][hostname] = archive.coverage
+        manifest['scenarios'][name] = entry
+
+    with open(os.path.join(root, MANIFEST_NAME), 'w') as afile:
+        json.dump(manifest, afile, indent=1, sort_keys=True)
+    return manifest
+
+
+def load_manifest(root):
+    with open(os.path.join(root, MANIFEST_NAME)) as afile:
+        return json.load(afile)
+
+
+def _as_tuples(rows):
+    return collections.Counter(
+        tuple(str(col) if isinstance(col, basestring) else col
+              for col in row) for row in rows)
+
+
+def read_scenario(root, name, backend, gap_threshold=GAP_THRESHOLD):
+
+    """
+    Reads every host of scenario name with backend, the way main does for a
+    hostname directory, and finds the time gaps of all hosts. Returns the
+    drops, reboots and gaps found, in the form of the manifest, the
+    coverage of every host, and the seconds it took.
+    """
+
+    scratch = tempfile.mkdtemp(prefix='regression_')
+    drops = []
+    reboots = []
+    file_timestamps = []
+    start_time = time.time()
+    try:
+        report = TextReport(os.path.join(scratch, 'dict_text.txt'),
+                            os.path.join(scratch, 'reboot_data.jsonl'))
+        for directory in get_host_directories(os.path.join(root, name)):
+            maintain_state = MaintainState()
+            for afile in sorted(get_list_of_files_in_directory(directory)):
+                process_gz_file(afile, report, maintain_state, backend)
+            for afile, errors in maintain_state.all_error_dict.iteritems():
+                for device_name, timestamp, discrepency_string in errors:
+                    drops.append((os.path.relpath(afile, root), device_name,
+                                  timestamp,
+                                  int(discrepency_string.rsplit(' ', 1)[-1])))
+            reboots.extend((interval.host, interval.start, interval.end,
+                            os.path.relpath(interval.filename, root))
+                           for interval in maintain_state.all_reboot_intervals)
+            file_timestamps.extend(maintain_state.file_timestamps)
+        gap_intervals, coverage = find_time_gaps(file_timestamps,
+                                                 gap_threshold)
+        report.close()
+        seconds = time.time() - start_time
+    finally:
+        shutil.rmtree(scratch)
+    gaps = [(interval.host, interval.start, interval.end,
+             os.path.relpath(interval.filename, root))
+            for interval in gap_intervals]
+    return drops, reboots, gaps, coverage, seconds
+
+
+def compare(label, expected, found):
+
+    """
+    Writes the rows missing from found and the unexpected ones to stderr.
+    Returns True if found holds exactly the expected rows.
+    """
+
+    expected = _as_tuples(expected)
+    found = _as_tuples(found)
+    for row in sorted((expected - found).elements()):
+        sys.stderr.write('%s missing: %s\n' % (label, row))
+    for row in sorted((found - expected).elements()):
+        sys.stderr.write('%s unexpected: %s\n' % (label, row))
+    return expected == found
+
+
+def check_index(root, name, entry):
+
+    """
+    Refreshes a scratch archive index over scenario name and checks that it
+    holds every file and host of the scenario, and that the time ranges of
+    consecutive files of a host are one sample interval apart unless a gap
+    of the manifest lies between them. Returns True if they are.
+    """
+
+    scratch = tempfile.mkdtemp(prefix='regression_index_')
+    try:
+        index = ArchiveIndex(os.path.join(scratch, 'archive_index.db'))
+        index.refresh(os.path.join(root, name))
+        entries = index.entries()
+        index.close()
+    finally:
+        shutil.rmtree(scratch)
+
+    correct = True
+    label = '%s/index' % name
+    hostnames = sorted(set(row['hostname'] for row in entries))
+    if len(entries) != entry['files'] or hostnames != sorted(entry['hosts']):
+        sys.stderr.write('%s: %d files of hosts %s, expected %d of %s\n' % (
+            label, len(entries), hostnames, entry['files'],
+            sorted(entry['hosts'])))
+        correct = False
+    gaps = set((hostname, start, end) for hostname, start, end, _
+               in entry['gaps'])
+    for previous, row in zip(entries, entries[1:]):
+        if previous['hostname'] != row['hostname']:
+            continue
+        if None in (previous['last_timestamp'], row['first_timestamp']) or \
+           (row['first_timestamp'] - previous['last_timestamp'] != INTERVAL
+            and (row['hostname'], previous['last_timestamp'],
+                 row['first_timestamp']) not in gaps):
+            sys.stderr.write('%s: %s ends at %s, %s starts at %s\n' % (
+                label, previous['path'], previous['last_timestamp'],
+                row['path'], row['first_timestamp']))
+            correct = False
+    return correct
+
+
+def check_corpus(root, backend_names=('python', 'numpy'), names=None,
+                 results=None):
+
+    """
+    Reads every scenario of the corpus at root, or those in names, with each
+    backend and checks the drops, reboots and time gaps found, and the time
+    coverage of every host, against the manifest, as well as an archive
+    index of the scenario, see check_index. The throughput of every run is
+    printed and appended to the tab separated file results, DEFAULT_RESULTS
+    in root by default. Returns True if every run found exactly what was
+    expected.
+    """
+
+    manifest = load_manifest(root)
+    results = results or os.path.join(root, DEFAULT_RESULTS)
+    new_results = not os.path.exists(results)
+    passed = True
+    with open(results, 'a') as results_file:
+        if new_results:
+            results_file.write('date\tscenario\tbackend\tfiles\tlines\t'
+                               'megabytes\tseconds\tlines_per_second\t'
+                               'result\n')
+        date = time.strftime('%Y-%m-%dT%H:%M:%S')
+        for name in sorted(names or manifest['scenarios']):
+            entry = manifest['scenarios'][name]
+            correct = check_index(root, name, entry)
+            passed &= correct
+            print '%-16s %-7s %4d files %s' % (name, 'index', entry['files'],
+                                               'ok' if correct else 'FAIL')
+            for backend_name in backend_names:
+                drops, reboots, gaps, coverage, seconds = read_scenario(
+                    root, name, BACKENDS[backend_name],
+                    manifest['gap_threshold'])
+                label = '%s/%s' % (name, backend_name)
+                correct = compare(label + ' drop', entry['drops'], drops)
+                correct &= compare(label + ' reboot', entry['reboots'],
+                                   reboots)
+                correct &= compare(label + ' gap', entry['gaps'], gaps)
+                for hostname, percent in sorted(entry['coverage'].iteritems()):
+                    if abs(coverage.get(hostname, -1) - percent) > 1e-6:
+                        sys.stderr.write('%s coverage of %s: %s, expected '
+                                         '%s\n' % (label, hostname,
+                                                   coverage.get(hostname),
+                                                   percent))
+                        correct = False
+                passed &= correct
+                result = 'ok' if correct else 'FAIL'
+                megabytes = entry['bytes'] / 1e6
+                lines_per_second = entry['lines'] / max(seconds, 1e-9)
+                print '%-16s %-7s %4d files %9d lines %8.2f s %10.0f ' \
+                    'lines/s %7.2f MB/s  %s' % (
+                        name, backend_name, entry['files'], entry['lines'],
+                        seconds, lines_per_second,
+                        megabytes / max(seconds, 1e-9), result)
+                results_file.write('%s\t%s\t%s\t%d\t%d\t%.3f\t%.3f\t%.0f\t'
+                                   '%s\n' % (date, name, backend_name,
+                                             entry['files'], entry['lines'],
+                                             megabytes, seconds,
+                                             lines_per_second, result))
+    return passed
+
+
+def main():
+
+    """
+    Generates a regression corpus or checks the parser against one
+    """
+
+    parser = argparse.ArgumentParser(description='Generate tacc stats '
+                                     'archives with known drops, reboots, '
+                                     'gaps, schema changes and counter wraps, '
+                                     'and check the parser against them')
+    parser.add_argument('directory', help='corpus directory')
+    parser.add_argument('--verbose', action='store_true',
+                        help='show the parser\'s log')
+    subparsers = parser.add_subparsers(dest='command')
+    generate = subparsers.add_parser('generate', help='write a new corpus, '
+                                     'replacing the directory')
+    generate.add_argument('--seed', type=int, default=0)
+    generate.add_argument('--scale', type=int, default=1,
+                          help='days of samples in every file')
+    check = subparsers.add_parser('check', help='check every backend '
+                                  'against the corpus')
+    check.add_argument('--backend', action='append', choices=sorted(BACKENDS),
+                       help='backend to check, may be repeated (default: '
+                            'all)')
+    check.add_argument('--scenario', action='append',
+                       help='scenario to check, may be repeated (default: '
+                            'all)')
+    check.add_argument('--results',
+                       help='throughput log (default: %s in the corpus '
+                            'directory)' % DEFAULT_RESULTS)
+    args = parser.parse_args()
+
+    # the parser logs every drop it finds as an error
+    logging.basicConfig(format='%(asctime)s [%(levelname)s] %(message)s',
+                        datefmt='%Y-%m-%dT%H:%M:%S',
+                        level=logging.DEBUG if args.verbose
+                        else logging.CRITICAL)
+
+    if args.command == 'generate':
+        if os.path.exists(args.directory):
+            if not os.path.isdir(args.directory) or (
+                    os.listdir(args.directory) and not os.path.exists(
+                        os.path.join(args.directory, MANIFEST_NAME))):
+                parser.error('%s exists and is not a corpus, not replacing '
+                             'it' % args.directory)
+            shutil.rmtree(args.directory)
+        os.makedirs(args.directory)
+        manifest = generate_corpus(args.directory, args.seed, args.scale)
+        for name, entry in sorted(manifest['scenarios'].iteritems()):
+            print '%-16s %2d hosts %4d files %9d lines %4d drops %3d ' \
+                'reboots %3d gaps' % (name, len(entry['hosts']),
+                                      entry['files'], entry['lines'],
+                                      len(entry['drops']),
+                                      len(entry['reboots']),
+                                      len(entry['gaps']))
+    elif not check_corpus(args.directory,
+                          args.backend or ('python', 'numpy'),
+                          args.scenario, args.results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
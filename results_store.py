@@ -0,0 +1,291 @@
+""" Local, indexed store for the iowait discrepancies found by the parser """
+import argparse
+import logging
+import re
+import sqlite3
+import sys
+
+HOSTNAME_REGEX = re.compile(r"(\w+-\w+.stampede.tacc.utexas.edu)")
+DISCREPENCY_REGEX = re.compile(r"(.+): (\d+)")
+
+DEFAULT_RESULTS_DB = 'iowait_results.db'
+
+SCHEMA_STATEMENTS = (
+    """CREATE TABLE IF NOT EXISTS discrepancies (
+           host TEXT NOT NULL,
+           device TEXT NOT NULL,
+           timestamp REAL,
+           discrepency INTEGER NOT NULL,
+           metric TEXT NOT NULL,
+           filename TEXT NOT NULL,
+           UNIQUE (host, device, timestamp, metric))""",
+    "CREATE INDEX IF NOT EXISTS idx_disc_host_ts ON discrepancies (host, timestamp)",
+    "CREATE INDEX IF NOT EXISTS idx_disc_ts ON discrepancies (timestamp)",
+    "CREATE INDEX IF NOT EXISTS idx_disc_dev_ts ON discrepancies (device, timestamp)",
+    """CREATE TABLE IF NOT EXISTS reboots (
+           host TEXT,
+           start REAL,
+           end REAL,
+           filename TEXT NOT NULL,
+           UNIQUE (host, end, filename))""",
+    "CREATE INDEX IF NOT EXISTS idx_reboot_host_end ON reboots (host, end)",
+    """CREATE TABLE IF NOT EXISTS gaps (
+           host TEXT,
+           start REAL NOT NULL,
+           end REAL NOT NULL,
+           filename TEXT NOT NULL,
+           UNIQUE (host, start, end))""",
+    "CREATE INDEX IF NOT EXISTS idx_gap_host_end ON gaps (host, end)",
+)
+
+
+def _time_window(start, end, column='timestamp'):
+
+    """
+    Builds the WHERE fragments and parameters restricting column to the
+    half open window [start, end). Either bound may be None.
+    """
+
+    clauses = []
+    params = []
+    if start is not None:
+        clauses.append('%s >= ?' % column)
+        params.append(start)
+    if end is not None:
+        clauses.append('%s < ?' % column)
+        params.append(end)
+    return clauses, params
+
+
+def _where(clauses):
+    if not clauses:
+        return ''
+    return ' WHERE ' + ' AND '.join(clauses)
+
+
+class ResultsStore(object):
+
+    """
+    Wraps a SQLite file holding one row per detected discrepancy and one per
+    reboot or time gap interval. The tables are indexed on host, timestamp
+    and device so range and top-N queries only touch the rows they need
+    instead of pulling whole tables like the R scripts do against MySQL.
+    """
+
+    def __init__(self, path=DEFAULT_RESULTS_DB):
+
+        self.path = path
+        self.con = sqlite3.connect(path)
+        for statement in SCHEMA_STATEMENTS:
+            self.con.execute(statement)
+        self.con.commit()
+
+    def close(self):
+        self.con.close()
+
+    def insert_error_dict(self, error_dict, hostname=None):
+
+        """
+        Inserts every tuple of an error dictionary as produced by
+        check_lists_for_discrepencies. The rows are stored under hostname,
+        the $hostname of the file header, like the reboots and gaps; without
+        it the host is taken from the file path. Rows already present are
+        ignored, the same way SqlInsert uses INSERT IGNORE. Returns the
+        number of tuples read from error_dict.
+        """
+
+        rows = []
+        for filename, errors in error_dict.iteritems():
+            host = hostname
+            if host is None:
+                hostname_regex = HOSTNAME_REGEX.search(filename)
+                if hostname_regex is None:
+                    logging.warning('No hostname for %s, not storing its '
+                                    '%d discrepancies', filename, len(errors))
+                    continue
+                host = hostname_regex.group(1)
+            for device_name, timestamp, discrepency_string in errors:
+                discrepency = DISCREPENCY_REGEX.search(discrepency_string)
+                if discrepency is None:
+                    continue
+                metric = 'cpuiowait' if 'iowait' in discrepency.group(1) \
+                    else discrepency.group(1)
+                rows.append((host, device_name, timestamp,
+                             int(discrepency.group(2)), metric, filename))
+        self.con.executemany("INSERT OR IGNORE INTO discrepancies "
+                             "(host, device, timestamp, discrepency, metric, "
+                             "filename) VALUES (?, ?, ?, ?, ?, ?)", rows)
+        self.con.commit()
+        return len(rows)
+
+    def insert_reboot_intervals(self, intervals):
+
+        """
+        Inserts (host, start, end, filename) reboot intervals, such as the
+        RebootInterval tuples collected by the parser. Returns the number of
+        intervals read.
+        """
+
+        rows = [tuple(interval) for interval in intervals]
+        self.con.executemany("INSERT OR IGNORE INTO reboots "
+                             "(host, start, end, filename) "
+                             "VALUES (?, ?, ?, ?)", rows)
+        self.con.commit()
+        return len(rows)
+
+    def insert_gap_intervals(self, intervals):
+
+        """
+        Inserts (host, start, end, filename) time gap intervals, such as the
+        GapInterval tuples found by find_time_gaps. Returns the number of
+        intervals read.
+        """
+
+        rows = [tuple(interval) for interval in intervals]
+        self.con.executemany("INSERT OR IGNORE INTO gaps "
+                             "(host, start, end, filename) "
+                             "VALUES (?, ?, ?, ?)", rows)
+        self.con.commit()
+        return len(rows)
+
+    def gap_intervals(self, host=None, start=None, end=None):
+
+        """
+        Returns the (host, start, end, filename) time gap intervals ending in
+        the window [start, end), ordered by time, so discrepancies next to
+        collection outages can be told apart
+        """
+
+        clauses, params = _time_window(start, end, 'end')
+        if host is not None:
+            clauses.insert(0, 'host = ?')
+            params.insert(0, host)
+        query = "SELECT host, start, end, filename FROM gaps" + \
+                _where(clauses) + " ORDER BY end"
+        return self.con.execute(query, params).fetchall()
+
+    def reboot_intervals(self, host=None, start=None, end=None):
+
+        """
+        Returns the (host, start, end, filename) reboot intervals ending in
+        the window [start, end), ordered by time, so discrepancies around
+        reboots can be masked
+        """
+
+        clauses, params = _time_window(start, end, 'end')
+        if host is not None:
+            clauses.insert(0, 'host = ?')
+            params.insert(0, host)
+        query = "SELECT host, start, end, filename FROM reboots" + \
+                _where(clauses) + " ORDER BY end"
+        return self.con.execute(query, params).fetchall()
+
+    def discrepancies(self, host=None, device=None, start=None, end=None):
+
+        """
+        Returns (host, device, timestamp, discrepency, filename) rows ordered
+        by time, optionally restricted to a host, a device and a time window
+        """
+
+        clauses, params = _time_window(start, end)
+        if host is not None:
+            clauses.insert(0, 'host = ?')
+            params.insert(0, host)
+        if device is not None:
+            clauses.append('device = ?')
+            params.append(device)
+        query = "SELECT host, device, timestamp, discrepency, filename " \
+                "FROM discrepancies" + _where(clauses) + \
+                " ORDER BY timestamp"
+        return self.con.execute(query, params).fetchall()
+
+    def top_hosts(self, start=None, end=None, limit=10):
+
+        """
+        Returns the limit hosts with the most drops between start and end as
+        a list of (host, count), largest first
+        """
+
+        clauses, params = _time_window(start, end)
+        query = "SELECT host, COUNT(*) AS num FROM discrepancies" + \
+                _where(clauses) + \
+                " GROUP BY host ORDER BY num DESC, host LIMIT ?"
+        return self.con.execute(query, params + [limit]).fetchall()
+
+    def top_devices(self, host, start=None, end=None, limit=10):
+
+        """
+        Returns the limit devices of a host with the most drops as a list of
+        (device, count), largest first
+        """
+
+        clauses, params = _time_window(start, end)
+        clauses.insert(0, 'host = ?')
+        params.insert(0, host)
+        query = "SELECT device, COUNT(*) AS num FROM discrepancies" + \
+                _where(clauses) + \
+                " GROUP BY device ORDER BY num DESC, device LIMIT ?"
+        return self.con.execute(query, params + [limit]).fetchall()
+
+    def size_histogram(self, host=None, start=None, end=None, bin_width=1,
+                       max_size=None):
+
+        """
+        Returns a histogram of discrepancy sizes as a list of
+        (bin_start, count). Sizes of max_size and above are left out, which
+        matches the 'discrepency < 50' cut used by discrepancy_sizes.R.
+        """
+
+        clauses, params = _time_window(start, end)
+        if host is not None:
+            clauses.insert(0, 'host = ?')
+            params.insert(0, host)
+        if max_size is not None:
+            clauses.append('discrepency < ?')
+            params.append(max_size)
+        query = "SELECT (discrepency / ?) * ? AS bin, COUNT(*) " \
+                "FROM discrepancies" + _where(clauses) + \
+                " GROUP BY bin ORDER BY bin"
+        return self.con.execute(query,
+                                [bin_width, bin_width] + params).fetchall()
+
+
+def main():
+
+    """
+    Small command line front end for querying a results store without
+    going through the central database
+    """
+
+    parser = argparse.ArgumentParser(description='Query a local iowait '
+                                     'discrepancy results store')
+    parser.add_argument('--db', default=DEFAULT_RESULTS_DB,
+                        help='results store written by example_parser.py')
+    parser.add_argument('--start', type=float, help='window start (epoch)')
+    parser.add_argument('--end', type=float, help='window end (epoch)')
+    subparsers = parser.add_subparsers(dest='query')
+    top = subparsers.add_parser('top', help='hosts with the most drops')
+    top.add_argument('--limit', type=int, default=10)
+    hist = subparsers.add_parser('hist', help='discrepancy size histogram')
+    hist.add_argument('--host')
+    hist.add_argument('--bin-width', type=int, default=1)
+    hist.add_argument('--max-size', type=int)
+    gaps = subparsers.add_parser('gaps', help='time gaps in the samples')
+    gaps.add_argument('--host')
+    args = parser.parse_args()
+
+    store = ResultsStore(args.db)
+    if args.query == 'top':
+        rows = store.top_hosts(args.start, args.end, args.limit)
+    elif args.query == 'gaps':
+        rows = store.gap_intervals(args.host, args.start, args.end)
+    else:
+        rows = store.size_histogram(args.host, args.start, args.end,
+                                    args.bin_width, args.max_size)
+    for row in rows:
+        sys.stdout.write('\t'.join(str(col) for col in row) + '\n')
+    store.close()
+
+
+if __name__ == "__main__":
+    main()